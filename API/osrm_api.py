@@ -7,6 +7,7 @@ class OSRMAPI:
     Если full‑обзор не срабатывает, пробуем simplified.
     """
     BASE_URL = "https://routing.openstreetmap.de/routed-foot/route/v1"
+    TABLE_URL = "https://routing.openstreetmap.de/routed-foot/table/v1"
 
     def __init__(self, mode: str = "foot"):
         self.mode = mode
@@ -28,3 +29,24 @@ class OSRMAPI:
         except requests.RequestException as e:
             print(f"[ERROR] OSRM request error: {e}")
             return {"error": str(e), "routes":[]}
+
+    @timing("OSRM_table_time")
+    def get_table(self, start: tuple, ends: list[tuple]):
+        """
+        Расстояние (м) и время (с) пути от start до каждой из точек одним запросом.
+        Для недостижимой точки — (None, None); None — если сервис не ответил.
+        """
+        if not ends:
+            return []
+        coords = ";".join(f"{lon},{lat}" for lat, lon in [start, *ends])
+        url = f"{self.TABLE_URL}/{self.mode}/{coords}?sources=0&annotations=distance,duration"
+        try:
+            resp = requests.get(url, timeout=10)
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"[ERROR] OSRM table request error: {e}")
+            return None
+        if resp.status_code != 200 or data.get("code") != "Ok":
+            print(f"[WARN] OSRM table: {data.get('message') or resp.status_code}")
+            return None
+        return list(zip(data["distances"][0][1:], data["durations"][0][1:]))
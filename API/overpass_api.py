@@ -1,63 +1,308 @@
 import requests
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Optional
+from helpers.geo_utils import distances_from
 from helpers.metrics import timing, incr
 
+# Теги, которые нужны для оценки мест и карточек; остальные Overpass не присылает
+PROJECTED_TAGS = (
+    "name", "wikidata", "wikipedia", "historic",
+    "addr:street", "addr:housenumber", "addr:city", "opening_hours",
+)
+
+
+class OverpassError(Exception):
+    """
+    Overpass не ответил или прервал запрос: пустой результат был бы неверным.
+    """
+
+
+@dataclass(slots=True)
+class POI:
+    """
+    Компактная запись места из Overpass: только нужные теги и одна точка
+    (у way/relation — центр). id — «тип/номер» (node/123): номера node и way
+    могут совпадать.
+    """
+    id: str
+    name: str
+    lat: float
+    lon: float
+    tags: dict[str, str] = field(default_factory=dict)
+    score: int = 1
+    distance: float = 0.0
+    preference: Optional[str] = None
+
+    @property
+    def coords(self) -> tuple[float, float]:
+        return self.lat, self.lon
+
+    def to_record(self) -> list:
+        return [self.id, self.name, self.lat, self.lon, self.tags]
+
+    @classmethod
+    def from_record(cls, record: list) -> "POI":
+        id, name, lat, lon, tags = record
+        return cls(id=id, name=name, lat=lat, lon=lon, tags=tags)
+
+    @classmethod
+    def from_element(cls, el: dict) -> Optional["POI"]:
+        """
+        Разбирает элемент ответа; без названия или координат возвращает None.
+        """
+        tags = {k: v for k, v in (el.get("tags") or {}).items() if v}
+        # convert заменяет тип элемента на poi, исходный приходит тегом osm_type
+        osm_type = tags.pop("osm_type", None) or el.get("type", "")
+        name = tags.get("name")
+        geometry = el.get("geometry") or {}
+        if geometry.get("type") == "Point":
+            lon, lat = geometry["coordinates"]
+        else:
+            point = el.get("center") or el
+            lat, lon = point.get("lat"), point.get("lon")
+        if not name or lat is None or lon is None:
+            return None
+        return cls(id=f"{osm_type}/{el.get('id', 0)}", name=name, lat=lat, lon=lon, tags=tags)
+
+
 class OverpassAPI:
     """
     Поиск POI через Overpass, с фильтрацией и динамическим радиусом.
+    Если передан tiles (кэш тайлов POI), поиск в радиусе идёт через него.
     """
 
     BASE_URL = "https://overpass-api.de/api/interpreter"
 
-    @timing("overpass_search_time")
+    def __init__(self, tiles=None):
+        self.tiles = tiles
+
     def search_poi_in_radius(self, lat, lon, radius, osm_key, osm_value, limit=50):
         """
         Базовый поиск (возвращаем побольше, дальше фильтруем).
         """
-        query = f"""
-        [out:json][timeout:25];
-        (
-          node["{osm_key}"="{osm_value}"](around:{radius},{lat},{lon});
-          way ["{osm_key}"="{osm_value}"](around:{radius},{lat},{lon});
-          relation["{osm_key}"="{osm_value}"](around:{radius},{lat},{lon});
-        );
-        out center;
+        return self.search_union(lat, lon, radius, [(osm_key, osm_value)], limit)
+
+    @staticmethod
+    def _convert(filters):
+        keys = dict.fromkeys(PROJECTED_TAGS + tuple(osm_key for osm_key, _ in filters))
+        projection = "".join(f',\n          "{key}" = t["{key}"]' for key in keys)
+        return f"""
+        convert poi
+          ::id = id(),
+          ::geom = center(geom()),
+          "osm_type" = type(){projection};"""
+
+    @staticmethod
+    def _select(osm_key, osm_value, area):
+        return f"""
+          node["{osm_key}"="{osm_value}"]({area});
+          way ["{osm_key}"="{osm_value}"]({area});
+          relation["{osm_key}"="{osm_value}"]({area});"""
+
+    @classmethod
+    def build_query(cls, area, filters, limit=None):
+        """
+        Один запрос по всем фильтрам (osm_key, osm_value) в области
+        area (around:... или юг,запад,север,восток).
+        Сервер отдаёт не больше limit элементов на каждый фильтр и только теги
+        из PROJECTED_TAGS и ключи фильтров; у way/relation вместо геометрии — центр.
+        """
+        convert = cls._convert(filters)
+
+        def union(group):
+            parts = [cls._select(osm_key, osm_value, area) for osm_key, osm_value in group]
+            return f"""
+        ({"".join(parts)}
+        );"""
+
+        if limit:
+            # Свой out на каждый фильтр, чтобы частый тег не занял весь лимит
+            blocks = [union([f]) + convert + f"\n        out geom qt {limit};" for f in filters]
+        else:
+            blocks = [union(filters) + convert + "\n        out geom qt;"]
+        return f"""
+        [out:json][timeout:25];{"".join(blocks)}
+        """
+
+    @classmethod
+    def build_union_query(cls, lat, lon, radius, filters, limit=None):
+        return cls.build_query(f"around:{radius},{lat},{lon}", filters, limit)
+
+    @classmethod
+    def build_ring_query(cls, lat, lon, radii, filters, limit):
+        """
+        Запрос по кольцам вокруг точки: для каждого фильтра и каждого кольца
+        между соседними радиусами из radii свой out с лимитом limit,
+        так что дальние места не вытесняют ближние.
+        """
+        convert = cls._convert(filters)
+        blocks = []
+        for osm_key, osm_value in filters:
+            inner = None
+            for radius in radii:
+                outer = cls._select(osm_key, osm_value, f"around:{radius},{lat},{lon}")
+                if inner is None:
+                    ring = f"""
+        ({outer}
+        );"""
+                else:
+                    ring = f"""
+        ({outer}
+        )->.outer;
+        ({cls._select(osm_key, osm_value, f"around:{inner},{lat},{lon}")}
+        )->.inner;
+        (.outer; - .inner;);"""
+                blocks.append(ring + convert + f"\n        out geom qt {limit};")
+                inner = radius
+        return f"""
+        [out:json][timeout:25];{"".join(blocks)}
+        """
+
+    def _fetch(self, query):
+        """
+        Выполняет запрос. None — если ответа нет или сервер прервал запрос,
+        чтобы неполный ответ не принять за пустой.
         """
         try:
-            resp = requests.get(self.BASE_URL, params={"data": query}, timeout=25)
-            data = resp.json() if resp.status_code == 200 else {}
-            elems = data.get("elements", [])
-            return elems
-        except requests.RequestException as e:
+            # POST: запрос по кольцам не помещается в URL
+            resp = requests.post(self.BASE_URL, data={"data": query}, timeout=25)
+            data = resp.json() if resp.status_code == 200 else None
+        except (requests.RequestException, ValueError) as e:
             print(f"[ERROR] Overpass API network: {e}")
-            return []
+            return None
+        if data is None or "runtime error" in data.get("remark", ""):
+            return None
+        elements = data.get("elements", [])
+        incr("overpass_elements", len(elements))
+        pois, seen = [], set()
+        for el in elements:
+            poi = POI.from_element(el)
+            # Место, подходящее под несколько фильтров, приходит в каждом из их out
+            if poi and poi.id not in seen:
+                seen.add(poi.id)
+                pois.append(poi)
+        return pois
+
+    @timing("overpass_search_time")
+    def search_union(self, lat, lon, radius, filters, limit=None):
+        """
+        Поиск сразу по нескольким фильтрам одним запросом.
+        Возвращает список POI; из кэша тайлов — отсортированный по расстоянию.
+        Если Overpass недоступен, бросает OverpassError.
+        """
+        if self.tiles is not None:
+            pois = self.tiles.query(lat, lon, radius, filters, self.search_bbox)
+            return self.limit_per_filter(pois, filters, limit) if limit else pois
+        pois = self._fetch(self.build_union_query(lat, lon, radius, filters, limit))
+        if pois is None:
+            raise OverpassError("Overpass не вернул места")
+        return pois
+
+    @timing("overpass_search_time")
+    def search_rings(self, lat, lon, radii, filters, limit):
+        """
+        Поиск по кольцам вокруг точки, не больше limit мест на фильтр в кольце.
+        Если Overpass недоступен, бросает OverpassError.
+        """
+        pois = self._fetch(self.build_ring_query(lat, lon, radii, filters, limit))
+        if pois is None:
+            raise OverpassError("Overpass не вернул места")
+        return pois
+
+    @staticmethod
+    def limit_per_filter(pois, filters, limit):
+        """
+        Оставляет не больше limit мест на каждый фильтр, сохраняя порядок.
+        """
+        counts = dict.fromkeys(filters, 0)
+        kept = []
+        for poi in pois:
+            matched = [f for f in filters if poi.tags.get(f[0]) == f[1] and counts[f] < limit]
+            if matched:
+                for f in matched:
+                    counts[f] += 1
+                kept.append(poi)
+        return kept
+
+    def search_bbox(self, bbox, filters, limit=None):
+        """
+        Места в прямоугольнике (юг, запад, север, восток), не больше limit
+        на каждый фильтр. None — если запрос не удался.
+        """
+        return self._fetch(self.build_query(",".join(f"{v:.6f}" for v in bbox), filters, limit))
+
+    @staticmethod
+    def score_tags(tags):
+        score = 1
+        if tags.get("wikidata") or tags.get("wikipedia"):
+            score += 5
+        if tags.get("historic") == "yes":
+            score += 2
+        if tags.get("addr:street"):
+            score += 1
+        return score
+
+    @staticmethod
+    def select_by_radius(candidates, initial_radius, step, max_radius, limit):
+        """
+        Расширение радиуса без повторных запросов: берётся наименьший радиус
+        из шагов, в котором набирается limit мест, внутри него — лучшие по
+        оценке, при равной оценке — ближние.
+        """
+        candidates = sorted(candidates, key=lambda poi: poi.distance)
+        distances = [poi.distance for poi in candidates]
+        radius = initial_radius
+        while radius < max_radius and bisect_right(distances, radius) < limit:
+            radius += step
+        within = candidates if radius >= max_radius else candidates[:bisect_right(distances, radius)]
+        within.sort(key=lambda poi: (-poi.score, poi.distance))
+        return within[:limit]
+
+    def find_popular_pois_batch(self, lat, lon, filters,
+                                initial_radius=1000, step=1000, max_radius=5000, limit=20,
+                                ring_limit=50):
+        """
+        То же, что find_popular_pois, но для нескольких фильтров одним
+        запросом. Места запрашиваются один раз в max_radius, расстояния
+        считаются локально, а выбор радиуса повторяется в памяти
+        отдельно для каждого фильтра. Элементы раскладываются по фильтрам,
+        которым соответствуют их теги. Расстояние в метрах сохраняется
+        в поле distance.
+        Ответ ограничен на сервере: через кэш тайлов — лимитом на тайлы,
+        без него — ring_limit мест на фильтр в каждом кольце между шагами
+        радиуса, так что лимит не отсекает ближние места.
+        Возвращает {(osm_key, osm_value): [POI]}.
+        """
+        filters = list(dict.fromkeys(filters))
+        if self.tiles is not None:
+            pois = self.search_union(lat, lon, max_radius, filters)
+        else:
+            radii = list(range(initial_radius, max_radius, step)) + [max_radius]
+            pois = self.search_rings(lat, lon, radii, filters, ring_limit)
+        incr("overpass_union_queries")
+        distances = distances_from((lat, lon), (poi.coords for poi in pois))
+
+        grouped = {f: [] for f in filters}
+        for poi, distance in zip(pois, distances):
+            poi.score = self.score_tags(poi.tags)
+            poi.distance = distance * 1000
+            for osm_key, osm_value in filters:
+                if poi.tags.get(osm_key) == osm_value:
+                    grouped[(osm_key, osm_value)].append(poi)
+        return {
+            f: self.select_by_radius(candidates, initial_radius, step, max_radius, limit)
+            for f, candidates in grouped.items()
+        }
 
     def find_popular_pois(self, lat, lon, osm_key, osm_value,
                           initial_radius=1000, step=1000, max_radius=5000, limit=20):
         """
         Динамический радиус + оценка важности:
         wikidata/wikipedia + historic + addr:street.
+        Оценка сохраняется в поле score каждого места.
         """
-        radius = initial_radius
-        candidates = []
-        while radius <= max_radius:
-            elems = self.search_poi_in_radius(lat, lon, radius, osm_key, osm_value, limit*3)
-            scored = []
-            for el in elems:
-                tags = el.get("tags", {})
-                name = tags.get("name")
-                if not name:
-                    continue
-                score = 1
-                if tags.get("wikidata") or tags.get("wikipedia"):
-                    score += 5
-                if tags.get("historic") == "yes":
-                    score += 2
-                if tags.get("addr:street"):
-                    score += 1
-                scored.append((score, el))
-            scored.sort(key=lambda x: -x[0])
-            candidates = [el for _, el in scored]
-            if len(candidates) >= limit or radius == max_radius:
-                break
-            radius += step
-        return candidates[:limit]
+        grouped = self.find_popular_pois_batch(
+            lat, lon, [(osm_key, osm_value)], initial_radius, step, max_radius, limit
+        )
+        return grouped[(osm_key, osm_value)]
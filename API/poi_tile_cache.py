@@ -0,0 +1,253 @@
+"""
+Общий дисковый кэш ответов Overpass по тайлам geohash. Запись — места одного
+тайла по одному фильтру (osm_key, osm_value). Запрос в радиусе собирается из
+покрывающих тайлов; устаревший тайл отдаётся сразу и обновляется в фоне.
+"""
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from API.overpass_api import POI, OverpassError
+from helpers.geo_utils import geohash_encode, geohash_bbox, geohash_cover, distances_from
+from helpers.metrics import incr, gauge
+from config import (
+    POI_TILE_CACHE_PATH, POI_TILE_PRECISION, POI_TILE_TTL, POI_TILE_MAX_STALE,
+    POI_TILE_FETCH_LIMIT, POI_TILE_MAX_ELEMENTS
+)
+
+Filter = tuple[str, str]
+BBoxFetch = Callable[[tuple[float, float, float, float], list[Filter], int], Optional[list[POI]]]
+
+
+class POITileCache:
+    """
+    Тайл свежий первые ttl секунд, затем до max_stale отдаётся как устаревший
+    с фоновым обновлением; более старый запрашивается заново синхронно.
+    Ответ Overpass ограничен fetch_limit мест на тег, загрузка тайлов
+    за один раз — max_elements мест.
+    """
+
+    def __init__(
+        self,
+        path: str = POI_TILE_CACHE_PATH,
+        precision: int = POI_TILE_PRECISION,
+        ttl: float = POI_TILE_TTL,
+        max_stale: float = POI_TILE_MAX_STALE,
+        fetch_limit: int = POI_TILE_FETCH_LIMIT,
+        max_elements: int = POI_TILE_MAX_ELEMENTS
+    ):
+        self.path = Path(path)
+        self.precision = precision
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.fetch_limit = fetch_limit
+        self.max_elements = max_elements
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._refreshing: set[tuple[str, Filter]] = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="poi-tiles")
+        self._hits = 0
+        self._lookups = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS poi_tiles (
+                    tile       TEXT NOT NULL,
+                    osm_key    TEXT NOT NULL,
+                    osm_value  TEXT NOT NULL,
+                    value      TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (tile, osm_key, osm_value)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS poi_tiles_fetched_at_idx ON poi_tiles (fetched_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, tiles: list[str], filters: list[Filter]) -> dict[tuple[str, Filter], tuple[list, float]]:
+        entries = {}
+        placeholders = ",".join("?" * len(tiles))
+        with self._lock:
+            conn = self._connection()
+            for osm_key, osm_value in filters:
+                rows = conn.execute(
+                    f"SELECT tile, value, fetched_at FROM poi_tiles "
+                    f"WHERE osm_key = ? AND osm_value = ? AND tile IN ({placeholders})",
+                    (osm_key, osm_value, *tiles)
+                ).fetchall()
+                for tile, value, fetched_at in rows:
+                    entries[(tile, (osm_key, osm_value))] = (json.loads(value), fetched_at)
+        return entries
+
+    def _store(self, records: dict[tuple[str, Filter], list]):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO poi_tiles (tile, osm_key, osm_value, value, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (tile, osm_key, osm_value, json.dumps(value, ensure_ascii=False), now)
+                    for (tile, (osm_key, osm_value)), value in records.items()
+                ]
+            )
+            conn.execute("DELETE FROM poi_tiles WHERE fetched_at < ?", (now - self.max_stale,))
+            conn.commit()
+
+    def _refresh(
+        self, pairs: list[tuple[str, Filter]], fetch: BBoxFetch, origin: tuple[float, float]
+    ) -> Optional[dict[tuple[str, Filter], list]]:
+        """
+        Запрашивает прямоугольник, охватывающий тайлы, не больше fetch_limit мест
+        на тег, и раскладывает места по тайлам. Если по тегу ответ упёрся в лимит,
+        его тайлы делятся пополам и запрашиваются заново, ближние к origin первыми,
+        пока всего не получено max_elements мест. Тайлы, оставшиеся неполными,
+        возвращаются, но не сохраняются. Если запрос не удался, ничего не пишет
+        и возвращает None.
+        """
+        records = {pair: [] for pair in pairs}
+        complete = set()
+        budget = self.max_elements
+        groups = [pairs]
+        while groups and budget > 0:
+            group = groups.pop(0)
+            tiles = sorted({tile for tile, _ in group})
+            filters = list(dict.fromkeys(f for _, f in group))
+            pois = fetch(self._bbox(tiles), filters, self.fetch_limit)
+            incr("poi_tile_fetches")
+            if pois is None:
+                incr("poi_tile_fetch_errors")
+                return None
+            budget -= len(pois)
+            requested = set(group)
+            for pair in requested:
+                records[pair] = []
+            counts = dict.fromkeys(filters, 0)
+            for poi in pois:
+                tile = geohash_encode(poi.lat, poi.lon, self.precision)
+                for osm_key, osm_value in filters:
+                    if poi.tags.get(osm_key) != osm_value:
+                        continue
+                    counts[(osm_key, osm_value)] += 1
+                    pair = (tile, (osm_key, osm_value))
+                    if pair in requested:
+                        records[pair].append(poi.to_record())
+            for f in filters:
+                part = sorted(pair for pair in group if pair[1] == f)
+                # Один тайл, упёршийся в лимит, хранится как есть: делить его некуда
+                if counts[f] < self.fetch_limit or len(part) == 1:
+                    complete.update(part)
+                    continue
+                incr("poi_tile_truncated")
+                half = len(part) // 2
+                groups += [part[:half], part[half:]]
+            groups.sort(key=lambda g: min(self._distance(origin, tile) for tile, _ in g))
+        if groups:
+            print(f"[WARN] Тайлы POI загружены не полностью: превышен лимит {self.max_elements} мест")
+        self._store({pair: value for pair, value in records.items() if pair in complete})
+        return records
+
+    @staticmethod
+    def _bbox(tiles: list[str]) -> tuple[float, float, float, float]:
+        boxes = [geohash_bbox(tile) for tile in tiles]
+        return (
+            min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes)
+        )
+
+    @staticmethod
+    def _distance(origin: tuple[float, float], tile: str) -> float:
+        s, w, n, e = geohash_bbox(tile)
+        return distances_from(origin, [((s + n) / 2, (w + e) / 2)])[0]
+
+    def _refresh_in_background(
+        self, pairs: list[tuple[str, Filter]], fetch: BBoxFetch, origin: tuple[float, float]
+    ):
+        with self._lock:
+            pairs = [pair for pair in pairs if pair not in self._refreshing]
+            self._refreshing.update(pairs)
+        if not pairs:
+            return
+
+        def run():
+            try:
+                self._refresh(pairs, fetch, origin)
+            except Exception as e:
+                print(f"[ERROR] Не удалось обновить тайлы POI: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(pairs)
+
+        incr("poi_tile_background_refresh")
+        self._executor.submit(run)
+
+    def query(self, lat: float, lon: float, radius: float, filters: list[Filter], fetch: BBoxFetch) -> list[POI]:
+        """
+        Места по фильтрам в радиусе radius метров, ближние первыми;
+        поле distance заполнено. fetch(bbox, filters, limit) запрашивает недостающие тайлы;
+        если это не удалось, бросает OverpassError.
+        """
+        filters = list(dict.fromkeys(filters))
+        tiles = geohash_cover(lat, lon, radius, self.precision)
+        entries = self._load(tiles, filters)
+        now = time.time()
+        records = {}
+        missing, stale = [], []
+        for tile in tiles:
+            for f in filters:
+                pair = (tile, f)
+                entry = entries.get(pair)
+                if entry is None or now - entry[1] > self.max_stale:
+                    missing.append(pair)
+                    continue
+                records[pair] = entry[0]
+                if now - entry[1] > self.ttl:
+                    stale.append(pair)
+        incr("poi_tile_hit", len(records) - len(stale))
+        incr("poi_tile_stale", len(stale))
+        incr("poi_tile_miss", len(missing))
+        with self._lock:
+            self._hits += len(records)
+            self._lookups += len(records) + len(missing)
+            gauge("poi_tile_hit_ratio", self.hit_ratio)
+
+        if missing:
+            fetched = self._refresh(missing, fetch, (lat, lon))
+            if fetched is None:
+                raise OverpassError("Не удалось загрузить тайлы POI")
+            records.update(fetched)
+        if stale:
+            self._refresh_in_background(stale, fetch, (lat, lon))
+
+        # Одно место лежит в записях каждого подходящего фильтра; id включает тип элемента
+        pois, seen = [], set()
+        for value in records.values():
+            for record in value:
+                if record[0] not in seen:
+                    seen.add(record[0])
+                    pois.append(POI.from_record(record))
+        distances = distances_from((lat, lon), (poi.coords for poi in pois))
+        nearby = []
+        for poi, distance in zip(pois, distances):
+            poi.distance = distance * 1000
+            if poi.distance <= radius:
+                nearby.append(poi)
+        nearby.sort(key=lambda poi: poi.distance)
+        return nearby
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Доля тайлов, отданных из кэша (включая устаревшие).
+        """
+        return self._hits / self._lookups if self._lookups else 0.0
+
+
+poi_tiles = POITileCache()
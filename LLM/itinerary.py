@@ -0,0 +1,125 @@
+"""
+Постраничный маршрут: сразу строится только первый день, остальные —
+когда пользователь их открывает. Следующий день заранее готовится в фоне.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Optional
+from helpers.cache import TTLCache
+from helpers.metrics import incr
+from LLM.llm import (
+    DEFAULT_MODEL, LOCATION_NOT_FOUND, ProgressCallback, DraftCallback, TripContext,
+    locate, resolve_trip, refresh_places, build_day_messages, generate_day, is_route_error
+)
+from LLM.validator import validate_route_content
+from LLM.route_cache import route_cache, RouteCache
+from config import ITINERARY_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class Itinerary:
+    def __init__(
+        self,
+        user_id: int,
+        trip: TripContext,
+        preferences: list[str],
+        route_type: str,
+        days: int,
+        budget: float,
+        is_first_time: bool,
+        model: str,
+        fresh: bool = False
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.trip = trip
+        self.days = days
+        self.budget = budget
+        self.model = model
+        self.fresh = fresh
+        self.cache_key = RouteCache.make_key(
+            trip.lat, trip.lon, preferences, route_type, days, budget, is_first_time, trip.exact_start
+        )
+        self.day_messages = build_day_messages(trip, preferences, route_type, days, budget, is_first_time, model)
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def _build_day(self, day: int, on_draft: Optional[DraftCallback]) -> str:
+        key = f"{self.cache_key}:day{day}"
+        cached = None if self.fresh else await asyncio.to_thread(route_cache.get, key)
+        if cached:
+            return cached
+        content = await generate_day(self.day_messages[day - 1], day, self.model, on_draft)
+        result = await validate_route_content(
+            content,
+            self.budget / self.days,
+            city=self.trip.city,
+            country=self.trip.country,
+            city_center=self.trip.center,
+            model=self.model,
+            geocodes=self.trip.geocodes
+        )
+        if not is_route_error(result) and not self.trip.degraded:
+            await asyncio.to_thread(route_cache.set, key, result)
+        incr("itinerary_days_generated")
+        return result
+
+    def _start(self, day: int, on_draft: Optional[DraftCallback] = None) -> asyncio.Task:
+        task = self._tasks.get(day)
+        if task is None or (task.done() and (task.cancelled() or task.exception() or is_route_error(task.result()))):
+            task = asyncio.create_task(self._build_day(day, on_draft), name=f"itinerary-{self.id}-{day}")
+            self._tasks[day] = task
+        return task
+
+    async def day(self, day: int, on_draft: Optional[DraftCallback] = None) -> str:
+        """
+        Текст дня: готовый, уже строящийся (в том числе предзагрузкой) или новый.
+        """
+        if day in self._tasks:
+            incr("itinerary_day_reused")
+        try:
+            return await asyncio.shield(self._start(day, on_draft))
+        except Exception as e:
+            logger.exception(f"[ITINERARY] Ошибка построения дня {day}: {e}")
+            return "Ошибка при генерации маршрута. Попробуйте ещё раз"
+
+    def prefetch(self, day: int):
+        if 1 <= day <= self.days and day not in self._tasks:
+            incr("itinerary_prefetch")
+            self._start(day)
+
+
+itineraries = TTLCache(ttl=ITINERARY_TTL)
+
+
+async def open_itinerary(
+    user_id: int,
+    departure: str,
+    preferences: list[str],
+    route_type: str,
+    days: int = 1,
+    budget: float = 0.0,
+    is_first_time: bool = True,
+    model: str = DEFAULT_MODEL,
+    progress: Optional[ProgressCallback] = None,
+    trip: Optional[TripContext] = None,
+    fresh: bool = False
+) -> Itinerary | str:
+    """
+    Готовит постраничный маршрут: место, город и найденные места определяются
+    один раз (или берутся из trip), сами дни — по запросу; fresh — не брать дни из кэша.
+    Возвращает текст ошибки, если место не найдено.
+    """
+    if trip is None:
+        if progress:
+            await progress("📍 Определяю местоположение")
+        coords = await locate(departure)
+        if not coords:
+            return LOCATION_NOT_FOUND
+        trip = await resolve_trip(departure, preferences, coords, progress)
+    else:
+        trip = await refresh_places(trip, preferences)
+    itinerary = Itinerary(user_id, trip, preferences, route_type, days, budget, is_first_time, model, fresh)
+    itineraries.set(itinerary.id, itinerary)
+    return itinerary
@@ -1,18 +1,32 @@
-import openai
-from LLM.rag import RAGService
-from LLM.validator import validate_route_content
+import math
+import asyncio
+from dataclasses import dataclass, field, replace
+from typing import Awaitable, Callable, Optional
+from LLM.validator import validate_route_content, extract_day_blocks
 from geopy.geocoders import Nominatim
-from config import API_KEY
-
-rag_service = RAGService()
-
-client = openai.OpenAI(
-    api_key=API_KEY,
-    base_url="https://hubai.loe.gg/v1"
+from loader import router, rag_service
+from helpers.metrics import gauge
+from helpers.singleflight import AsyncSingleFlight
+from helpers.stages import Stage, StageGraph, GraphResult, Stop, stage_timer
+from LLM.route_cache import route_cache, RouteCache
+from LLM.structured import request_structured_route, render_structured_route
+from LLM.prompts import pack_context, user_prompt, route_messages
+from LLM.tokens import record_usage
+from config import (
+    ROUTE_OUTPUT_MODE, ROUTE_PARALLEL_DAYS, DAY_MAX_TOKENS,
+    GEOCODE_TIMEOUT, REVERSE_GEOCODE_TIMEOUT, PLACES_TIMEOUT
 )
 
+ProgressCallback = Callable[[str], Awaitable[None]]
+DraftCallback = Callable[[str], Awaitable[None]]
+TripCallback = Callable[["TripContext"], Awaitable[None]]
+
 DEFAULT_MODEL = "gpt-3.5-turbo"
 
+LOCATION_NOT_FOUND = "Похоже, вы указали некорректное или несуществующее место. Пожалуйста, введите реальный город."
+
+UNKNOWN_PLACE = ("неизвестный город", "неизвестная страна")
+
 def get_city_and_country_from_coords(lat: float, lon: float) -> tuple[str, str]:
     """
     Возвращает кортеж (город, страна) по заданным координатам.
@@ -21,114 +35,436 @@ def get_city_and_country_from_coords(lat: float, lon: float) -> tuple[str, str]:
         geolocator = Nominatim(user_agent="tripbot")
         location = geolocator.reverse((lat, lon), language="ru", timeout=10)
         address = location.raw.get("address", {})
-        city = address.get("city") or address.get("town") or address.get("village") or address.get("state") or "неизвестный город"
-        country = address.get("country", "неизвестная страна")
+        city = address.get("city") or address.get("town") or address.get("village") or address.get("state") or UNKNOWN_PLACE[0]
+        country = address.get("country", UNKNOWN_PLACE[1])
         return city, country
     except Exception as e:
         print(f"[ERROR] Не удалось определить город и страну по координатам: {e}")
-        return "неизвестный город", "неизвестная страна"
+        return UNKNOWN_PLACE
+
+def is_route_error(text: str) -> bool:
+    return not text or text.startswith("Ошибка")
+
+async def stream_completion(messages: list[dict], model: str, on_draft: DraftCallback, **params) -> str:
+    """
+    Потоковый запрос к модели: on_draft вызывается с накопленным текстом.
+    Возвращает полный ответ.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    parts: list[str] = []
+    stream = await router.create(model=model, messages=messages, stream=True, **params)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if not parts:
+            gauge("llm_first_token_time", loop.time() - started)
+        parts.append(delta)
+        await on_draft("".join(parts))
+    return "".join(parts).strip()
+
+def partition_places(places: list[dict], days: int, center: tuple[float, float]) -> list[list[dict]]:
+    """
+    Делит места между днями: сортирует по направлению от точки старта
+    и режет на days почти равных секторов, чтобы места одного дня были рядом.
+    """
+    ordered = sorted(places, key=lambda p: math.atan2(p["lon"] - center[1], p["lat"] - center[0]))
+    size, extra = divmod(len(ordered), days)
+    groups, start = [], 0
+    for i in range(days):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(ordered[start:end])
+        start = end
+    return groups
+
+def normalize_day(text: str, day: int) -> str:
+    """
+    Оставляет из ответа модели один день и ставит ему правильный заголовок.
+    """
+    blocks = extract_day_blocks(text)
+    body = blocks[0][1] if blocks else text.strip()
+    return f"День {day}:\n{body}"
+
+async def generate_day(
+    messages: list[dict],
+    day: int,
+    model: str,
+    on_draft: Optional[DraftCallback] = None
+) -> str:
+    """
+    Генерирует один день маршрута отдельным запросом с бюджетом DAY_MAX_TOKENS.
+    """
+    if on_draft:
+        content = await stream_completion(messages, model, on_draft, temperature=0.7, max_tokens=DAY_MAX_TOKENS)
+        record_usage("day", model, messages, content)
+    else:
+        response = await router.create(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=DAY_MAX_TOKENS
+        )
+        content = (response.choices[0].message.content or "").strip()
+        record_usage("day", model, messages, content, response.usage)
+    return normalize_day(content, day)
+
+async def generate_days(day_messages: list[list[dict]], model: str, on_draft: Optional[DraftCallback] = None) -> str:
+    """
+    Генерирует дни параллельно и склеивает их по порядку.
+    При потоковом режиме on_draft получает текущие черновики всех дней сразу.
+    """
+    drafts = [""] * len(day_messages)
+
+    def day_draft(index: int) -> Optional[DraftCallback]:
+        if not on_draft:
+            return None
+
+        async def on_day_draft(text: str):
+            drafts[index] = text
+            await on_draft("\n\n".join(d for d in drafts if d))
+        return on_day_draft
+
+    days = await asyncio.gather(*(
+        generate_day(messages, i + 1, model, day_draft(i)) for i, messages in enumerate(day_messages)
+    ))
+    return "\n\n".join(days)
+
+@dataclass
+class TripContext:
+    """
+    Всё, что известно о месте поездки до обращения к модели:
+    точка старта, город и страна, найденные места (для preferences)
+    и уже полученные координаты адресов. Переиспользуется при перестроении маршрута.
+    degraded — места не получены (ошибка или таймаут поиска):
+    такой контекст и маршрут по нему не кэшируются, места запрашиваются заново.
+    """
+    lat: float
+    lon: float
+    city: str
+    country: str
+    places: list[dict]
+    exact_start: bool = False
+    preferences: list[str] = field(default_factory=list)
+    geocodes: dict = field(default_factory=dict)
+    degraded: bool = False
+
+    @property
+    def center(self) -> tuple[float, float]:
+        return self.lat, self.lon
+
+    @property
+    def start_coords(self) -> Optional[tuple[float, float]]:
+        return self.center if self.exact_start else None
+
+async def locate(departure: str) -> Optional[tuple[float, float]]:
+    return await asyncio.to_thread(rag_service.get_coordinates, departure)
+
+def trip_stages(
+    departure: str,
+    preferences: list[str],
+    progress: Optional[ProgressCallback] = None,
+    after: tuple[str, ...] = ()
+) -> list[Stage]:
+    """
+    Этапы подготовки контекста поездки. Обратное геокодирование и поиск мест
+    не зависят друг от друга (оба нужны только координаты) и идут параллельно.
+    """
+    async def reverse_geocode(results: dict) -> tuple[str, str]:
+        lat, lon = results["coords"]
+        return await asyncio.to_thread(get_city_and_country_from_coords, lat, lon)
+
+    async def find_places(results: dict) -> list[dict]:
+        if progress:
+            await progress("🔎 Ищу интересные места")
+        lat, lon = results["coords"]
+        return await asyncio.to_thread(
+            rag_service.retrieve_places,
+            location_name=departure,
+            preferences=preferences,
+            lat=lat,
+            lon=lon
+        )
+
+    deps = ("coords",) + after
+    return [
+        Stage("reverse_geocode", reverse_geocode, deps, timeout=REVERSE_GEOCODE_TIMEOUT, default=UNKNOWN_PLACE),
+        Stage("places", find_places, deps, timeout=PLACES_TIMEOUT, default=[]),
+    ]
+
+def trip_from_results(departure: str, preferences: list[str], result: GraphResult) -> TripContext:
+    lat, lon = result["coords"]
+    city_name, country = result["reverse_geocode"]
+    return TripContext(
+        lat, lon, city_name, country, result["places"],
+        exact_start="," in departure, preferences=list(preferences),
+        degraded="places" in result.fallbacks
+    )
+
+async def resolve_trip(
+    departure: str,
+    preferences: list[str],
+    coords: tuple[float, float],
+    progress: Optional[ProgressCallback] = None
+) -> TripContext:
+    """
+    Определяет город и страну по координатам и ищет места по предпочтениям.
+    """
+    result = await StageGraph("trip", trip_stages(departure, preferences, progress)).run(coords=coords)
+    return trip_from_results(departure, preferences, result)
+
+async def refresh_places(trip: TripContext, preferences: list[str]) -> TripContext:
+    """
+    Тот же контекст поездки, но с местами под новые предпочтения;
+    город, координаты и известные адреса не запрашиваются заново.
+    Если места в прошлый раз не были получены, они запрашиваются снова.
+    """
+    if not trip.degraded and sorted(trip.preferences) == sorted(preferences):
+        return trip
+    try:
+        places = await asyncio.wait_for(
+            asyncio.to_thread(
+                rag_service.retrieve_places,
+                location_name=trip.city,
+                preferences=preferences,
+                lat=trip.lat,
+                lon=trip.lon
+            ),
+            PLACES_TIMEOUT
+        )
+    except Exception as e:
+        print(f"[ERROR] Не удалось найти места: {e!r}")
+        return replace(trip, places=[], preferences=list(preferences), degraded=True)
+    return replace(trip, places=places, preferences=list(preferences), degraded=False)
+
+def build_day_messages(
+    trip: TripContext,
+    preferences: list[str],
+    route_type: str,
+    days: int,
+    budget: float,
+    is_first_time: bool,
+    model: str
+) -> list[list[dict]]:
+    """
+    Запросы по дням: места делятся между днями, каждый запрос знает
+    о местах других дней, чтобы не повторять их.
+    """
+    groups = partition_places(trip.places, days, trip.center)
+    return [
+        route_messages(user_prompt(
+            trip.city, preferences, route_type, days, budget, is_first_time,
+            context=pack_context(group, model=model) if group else "Справочных мест на этот день нет, подбери их сам.",
+            start_coords=trip.start_coords,
+            day=day,
+            avoid=[p["name"] for other in groups if other is not group for p in other]
+        ))
+        for day, group in enumerate(groups, 1)
+    ]
+
+_route_flight = AsyncSingleFlight("route")
+_route_listeners: dict[tuple, list[tuple[Optional[ProgressCallback], Optional[DraftCallback], Optional[TripCallback]]]] = {}
+# Контекст поездки текущего построения: его получают и те, кто присоединился позже
+_route_trips: dict[tuple, TripContext] = {}
 
-def generate_route(
+async def generate_route(
     departure: str,
     preferences: list[str],
     route_type: str,
     days: int = 1,
     budget: float = 0.0,
     is_first_time: bool = True,
-    model: str = DEFAULT_MODEL
+    model: str = DEFAULT_MODEL,
+    progress: Optional[ProgressCallback] = None,
+    on_draft: Optional[DraftCallback] = None,
+    trip: Optional[TripContext] = None,
+    fresh: bool = False,
+    on_trip: Optional[TripCallback] = None
 ) -> str:
-    coords = rag_service.get_coordinates(departure)
-    if not coords:
-        return "Похоже, вы указали некорректное или несуществующее место. Пожалуйста, введите реальный город."
+    """
+    Строит маршрут (см. _generate_route). Одинаковые запросы, пришедшие,
+    пока такой маршрут уже строится, не запускают построение заново:
+    они ждут текущее, получают его этапы и черновик и тот же результат;
+    уже готовый контекст поездки передаётся им в on_trip сразу.
+    """
+    key = (
+        departure.strip().lower(), tuple(sorted({p.strip().lower() for p in preferences})),
+        route_type, days, budget, is_first_time, model, fresh
+    )
+    listeners = _route_listeners.setdefault(key, [])
+    listener = (progress, on_draft, on_trip)
+    listeners.append(listener)
 
-    lat, lon = coords
-    is_coords_input = "," in departure
+    async def broadcast(index: int, value):
+        callbacks = [listener[index] for listener in list(listeners) if listener[index]]
+        await asyncio.gather(*(callback(value) for callback in callbacks), return_exceptions=True)
 
-    city_name, country = get_city_and_country_from_coords(lat, lon)
-    retrieved_docs = rag_service.retrieve_documents(
-        location_name=city_name,
-        preferences=preferences,
-        lat=lat,
-        lon=lon
-    )
+    async def broadcast_progress(stage: str):
+        await broadcast(0, stage)
 
-    if len(retrieved_docs) > 3000:
-        retrieved_docs = retrieved_docs[:3000] + "\n..."
-
-    budget_text = ""
-    if budget > 0:
-        daily_budget = budget / days
-        min_spend = int(daily_budget * 0.7)
-        budget_text = (
-            f"Общий бюджет: {budget} рублей на {days} дн. (~{int(daily_budget)} руб/день)\n"
-            f"Желательно тратить не менее 70% дневного бюджета (от {min_spend} руб/день)\n"
-            "Предусмотри кафе, мероприятия, музеи или прогулки с затратами\n"
-        )
+    async def broadcast_draft(text: str):
+        await broadcast(1, text)
 
-    first_time_text = (
-        f"Пользователь впервые в городе — включи известные достопримечательности, например\n"
-        f"Биг Бен для Лондона, Красная площадь для Москвы, Эйфелева Башня в Париже... дальше по аналогии"
-        if is_first_time else
-        "Пользователь уже был в городе — предложи менее туристические, интересные места\n"
-    )
+    async def broadcast_trip(context: TripContext):
+        _route_trips[key] = context
+        await broadcast(2, context)
 
-    day_instruction = (
-        "Укажи не менее 5 интересных мест в день\n"
-        if days == 1 else
-        "Для каждого дня предложи минимум 3 интересных места\n"
-    )
+    try:
+        ready = _route_trips.get(key)
+        if on_trip and ready is not None:
+            await asyncio.gather(on_trip(ready), return_exceptions=True)
+        return await _route_flight.do(key, lambda: _generate_route(
+            departure, preferences, route_type, days, budget, is_first_time, model,
+            progress=broadcast_progress,
+            on_draft=broadcast_draft,
+            trip=trip,
+            fresh=fresh,
+            on_trip=broadcast_trip
+        ))
+    finally:
+        listeners.remove(listener)
+        if not listeners and _route_listeners.get(key) is listeners:
+            del _route_listeners[key]
+            _route_trips.pop(key, None)
+
+async def _generate_route(
+    departure: str,
+    preferences: list[str],
+    route_type: str,
+    days: int = 1,
+    budget: float = 0.0,
+    is_first_time: bool = True,
+    model: str = DEFAULT_MODEL,
+    progress: Optional[ProgressCallback] = None,
+    on_draft: Optional[DraftCallback] = None,
+    trip: Optional[TripContext] = None,
+    fresh: bool = False,
+    on_trip: Optional[TripCallback] = None
+) -> str:
+    """
+    Строит маршрут. Блокирующие геосервисы выполняются в потоках,
+    запросы к LLM — асинхронным клиентом, так что event loop не блокируется.
+    progress получает описание текущего этапа для статус-сообщения.
+    Если передан on_draft, черновик запрашивается потоком и on_draft
+    получает накопленный текст после каждого фрагмента.
+    В режиме ROUTE_OUTPUT_MODE=structured модель один раз возвращает JSON,
+    текст собирается локально, без проверочного запроса и потока.
+    Многодневный маршрут в текстовом режиме (ROUTE_PARALLEL_DAYS=1) строится
+    по дням параллельно: места делятся между днями, каждый день — отдельный запрос.
+    Если передан trip (контекст прошлого построения), место, город, найденные
+    места и координаты адресов берутся из него; fresh — не брать маршрут из кэша.
+    on_trip получает контекст поездки, чтобы его можно было переиспользовать.
+    """
+    async def report(stage: str):
+        if progress:
+            await progress(stage)
 
-    if is_coords_input:
-        start_point_text = (
-            f"Начинай маршрут каждый день из точки координат {lat}, {lon} — это местоположение пользователя (например, отель).\n"
-            "Первая точка маршрута всегда должна быть недалеко от неё.\n"
+    is_coords_input = "," in departure
+    structured = ROUTE_OUTPUT_MODE == "structured"
+
+    def route_key(coords: tuple[float, float]) -> str:
+        return RouteCache.make_key(
+            coords[0], coords[1], preferences, route_type, days, budget, is_first_time, exact_start=is_coords_input
         )
+
+    if trip is None:
+        async def geocode(results: dict):
+            coords = await locate(departure)
+            return coords if coords else Stop(LOCATION_NOT_FOUND)
+
+        async def lookup_cache(results: dict):
+            key = route_key(results["coords"])
+            cached = None if fresh else await asyncio.to_thread(route_cache.get, key)
+            return Stop(cached) if cached else key
+
+        await report("📍 Определяю местоположение")
+        pipeline = await StageGraph("route", [
+            Stage("coords", geocode, timeout=GEOCODE_TIMEOUT, default=Stop(LOCATION_NOT_FOUND)),
+            Stage("cache_key", lookup_cache, deps=("coords",)),
+            *trip_stages(departure, preferences, progress, after=("cache_key",)),
+        ]).run()
+        if pipeline.stopped:
+            return pipeline.stopped.value
+        cache_key = pipeline["cache_key"]
+        trip = trip_from_results(departure, preferences, pipeline)
     else:
-        start_point_text = ""
-
-    prompt = (
-        f"Составь маршрут из точки '{city_name}' на {days} "
-        f"{'день' if days == 1 else 'дня' if 2 <= days <= 4 else 'дней'}, "
-        f"учитывая предпочтения: {', '.join(preferences)} и тип маршрута: {route_type}.\n"
-        f"{first_time_text}"
-        f"{budget_text}"
-        f"{day_instruction}"
-        f"{start_point_text}"
-        "Каждый день маршрута начинай с заголовка 'День N:', где N — номер дня.\n"
-        "Внутри каждого дня используй нумерацию достопримечательностей (1, 2, 3...) для удобства восприятия.\n"
-        "Для каждого пункта маршрута обязательно укажи полное название места и на отдельной строке его полный адрес в формате:\n"
-        "Адрес: <полный адрес, включая город и страну>\n"
-        "Если адрес определить невозможно, укажи примерный адрес (например, центр города).\n"
-        "В конце каждого дня маршрута обязательно добавь строку с координатами в формате:\n"
-        "Координаты: (lat, lon), (lat, lon), ...\n"
-        "Если координаты невозможно определить — всё равно вставь примерные (например, центр города), иначе маршрут не сработает.\n"
-        "Координаты критичны для построения карты. Без них маршрут будет считаться ошибочным!\n"
-        "Не используй markdown, жирный текст или хештеги.\n"
-        f"\nВот справочная информация:\n{retrieved_docs}"
-    )
+        cache_key = route_key(trip.center)
+        cached = None if fresh else await asyncio.to_thread(route_cache.get, cache_key)
+        if cached:
+            return cached
+        trip = await refresh_places(trip, preferences)
 
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Ты туристический консультант. Отвечай чистым текстом, без Markdown."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1600
+    lat, lon = trip.center
+    if on_trip:
+        await on_trip(trip)
+    city_name, country = trip.city, trip.country
+
+    parallel = ROUTE_PARALLEL_DAYS and not structured and days > 1
+    if parallel:
+        day_messages = build_day_messages(trip, preferences, route_type, days, budget, is_first_time, model)
+    else:
+        prompt = user_prompt(
+            city_name, preferences, route_type, days, budget, is_first_time,
+            context=pack_context(trip.places, model=model),
+            start_coords=trip.start_coords
         )
-        content = response.choices[0].message.content.strip()
+        messages = route_messages(prompt, structured=structured)
+
+    try:
+        await report("✍️ Составляю маршрут")
+        if structured:
+            with stage_timer("draft"):
+                route = await request_structured_route(
+                    router,
+                    messages,
+                    model,
+                    temperature=0.7,
+                    max_tokens=1600
+                )
+            if not route:
+                return "Ошибка: модель не вернула маршрут. Попробуйте позже"
+            await report("🗺️ Проверяю адреса и строю карты")
+            result = await asyncio.to_thread(
+                render_structured_route, route, city_name, country, (lat, lon), trip.geocodes
+            )
+            if not trip.degraded:
+                await asyncio.to_thread(route_cache.set, cache_key, result)
+            return result
+
+        with stage_timer("draft"):
+            if parallel:
+                content = await generate_days(day_messages, model, on_draft)
+            elif on_draft:
+                content = await stream_completion(messages, model, on_draft, temperature=0.7, max_tokens=1600)
+                record_usage("draft", model, messages, content)
+            else:
+                response = await router.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1600
+                )
+                content = response.choices[0].message.content.strip()
+                record_usage("draft", model, messages, content, response.usage)
         if not content:
             print("[ERROR] Модель вернула пустой ответ")
             return "Ошибка: модель не вернула маршрут. Попробуйте позже"
-        return validate_route_content(
-            content,
-            budget,
-            city=city_name,
-            country=country,
-            city_center=(lat, lon),
-            model=model
-        )
+        await report("🗺️ Проверяю адреса и строю карты")
+        with stage_timer("validation"):
+            result = await validate_route_content(
+                content,
+                budget,
+                city=city_name,
+                country=country,
+                city_center=(lat, lon),
+                model=model,
+                geocodes=trip.geocodes
+            )
+        if not is_route_error(result) and not trip.degraded:
+            await asyncio.to_thread(route_cache.set, cache_key, result)
+        return result
     except Exception as e:
         print(f"[ERROR] Ошибка при вызове HubAI API: {e}")
         return "Ошибка при генерации маршрута. Попробуйте ещё раз"
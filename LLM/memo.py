@@ -0,0 +1,23 @@
+"""
+Контекст последнего маршрута пользователя для перестроения с изменёнными
+параметрами: ответы анкеты и всё, что уже получено от геосервисов.
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+from helpers.cache import TTLCache
+from LLM.llm import TripContext
+from config import ROUTE_MEMO_TTL
+
+
+@dataclass
+class RouteMemo:
+    data: dict[str, Any]
+    trip: Optional[TripContext] = None
+
+    async def remember(self, trip: TripContext):
+        # Без найденных мест контекст не запоминается: перестроение запросит их заново
+        if not trip.degraded:
+            self.trip = trip
+
+
+route_memos = TTLCache(ttl=ROUTE_MEMO_TTL)
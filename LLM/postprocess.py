@@ -132,13 +132,32 @@ def extract_place_name_from_text(line: str) -> str:
         return match.group(1).strip()
     return line.split('.')[0].strip()
 
-def enrich_route_with_coordinates(route_text: str, city: str, country: str, city_center: Tuple[float, float]) -> str:
+def geocode_cached(name: str, city: str, country: str, geocodes: Optional[dict] = None) -> Optional[Tuple[float, float]]:
+    """
+    get_coords_from_name с запоминанием результатов в geocodes (если передан),
+    чтобы повторная сборка маршрута не обращалась к геокодеру за теми же местами.
+    """
+    if geocodes is None:
+        return get_coords_from_name(name, city, country)
+    key = name.strip().lower()
+    if key not in geocodes:
+        geocodes[key] = get_coords_from_name(name, city, country)
+    return geocodes[key]
+
+def enrich_route_with_coordinates(
+    route_text: str,
+    city: str,
+    country: str,
+    city_center: Tuple[float, float],
+    geocodes: Optional[dict] = None
+) -> str:
     """
     Обогащает текст маршрута, формируя ссылку на Яндекс.Карты с использованием полных адресов POI.
     Если в тексте присутствуют строки "Адрес:", они используются для геокодирования.
     Если их нет, пробуем извлечь данные из строк с префиксом "poi:".
     Если и это не срабатывает, применяем эвристику для извлечения названия.
-    Для каждого адреса получаем координаты с ограничением области поиска (bounding box).
+    Для каждого адреса получаем координаты с ограничением области поиска (bounding box);
+    уже известные координаты берутся из geocodes.
     """
     day_blocks = re.split(r"(День\s+\d+:)", route_text)
     result = ""
@@ -158,7 +177,7 @@ def enrich_route_with_coordinates(route_text: str, city: str, country: str, city
         day_coords = [city_center]
 
         for addr in addresses:
-            coord = get_coords_from_name(addr, city, country)
+            coord = geocode_cached(addr, city, country, geocodes)
             if coord:
                 day_coords.append(coord)
             else:
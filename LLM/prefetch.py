@@ -0,0 +1,101 @@
+"""
+Предварительная загрузка контекста поездки, пока пользователь отвечает
+на вопросы анкеты: как только известна точка старта, в фоне определяются
+город и страна и ищутся места; после последнего вопроса о предпочтениях
+поиск мест уточняется. Построение маршрута забирает готовый результат.
+"""
+import asyncio
+import logging
+from typing import Optional
+from helpers.cache import TTLCache
+from helpers.metrics import incr, gauge
+from LLM.llm import TripContext, resolve_trip, refresh_places
+from config import TRIP_PREFETCH_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class TripPrefetcher:
+    """
+    Для каждого пользователя хранит пару задач: базовую (город и места
+    по умолчанию) и текущую (последнее уточнение под предпочтения).
+    """
+
+    def __init__(self, ttl: float = TRIP_PREFETCH_TTL):
+        self._tasks = TTLCache(ttl=ttl)
+
+    @staticmethod
+    def _track(task: asyncio.Task) -> asyncio.Task:
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def start(self, key, departure: str, coords: tuple[float, float]):
+        """
+        Запускает определение города и поиск мест по умолчанию.
+        """
+        self.cancel(key)
+        task = self._track(asyncio.create_task(resolve_trip(departure, [], coords)))
+        self._tasks.set(key, (task, task))
+        incr("trip_prefetch_started")
+
+    def refine(self, key, preferences: list[str]):
+        """
+        Уточняет поиск мест под выбранные предпочтения поверх базовой загрузки;
+        предыдущее уточнение отменяется (но начатый им запрос в потоке
+        дорабатывает, поэтому вызывать стоит один раз, после всех предпочтений).
+        """
+        pair = self._tasks.get(key)
+        if pair is None:
+            return
+        base, current = pair
+        if current is not base:
+            current.cancel()
+
+        async def refined() -> TripContext:
+            return await refresh_places(await asyncio.shield(base), preferences)
+
+        self._tasks.set(key, (base, self._track(asyncio.create_task(refined()))))
+        incr("trip_prefetch_refined")
+
+    def peek(self, key) -> Optional[asyncio.Task]:
+        """
+        Текущая задача без изъятия: её забирают pop после того, как маршрут
+        принят в очередь, или отменяют cancel.
+        """
+        pair = self._tasks.get(key)
+        return pair[1] if pair else None
+
+    def pop(self, key) -> Optional[asyncio.Task]:
+        pair = self._tasks.get(key)
+        self._tasks.invalidate(key)
+        return pair[1] if pair else None
+
+    def cancel(self, key):
+        pair = self._tasks.get(key)
+        self._tasks.invalidate(key)
+        if pair:
+            for task in pair:
+                task.cancel()
+
+    @staticmethod
+    async def result(task: asyncio.Task, timeout: float) -> Optional[TripContext]:
+        """
+        Дожидается предзагрузки не дольше timeout; при ошибке или таймауте
+        возвращает None, и контекст строится обычным путём.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            trip = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            incr("trip_prefetch_timeout")
+            return None
+        except Exception as e:
+            logger.warning(f"[PREFETCH] Предзагрузка не удалась: {e}")
+            return None
+        gauge("trip_prefetch_wait", loop.time() - started)
+        incr("trip_prefetch_used")
+        return trip
+
+
+trip_prefetcher = TripPrefetcher()
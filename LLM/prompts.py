@@ -0,0 +1,134 @@
+"""
+Шаблоны запросов к модели. Неизменная часть (роль, правила и формат ответа)
+идёт первой, в системном сообщении, — так префикс запроса одинаков для всех
+пользователей и попадает в кэш промптов провайдера. Параметры поездки и
+справочные места идут следом, в сообщении пользователя; места упаковываются
+по оценке важности в пределах бюджета токенов.
+"""
+from typing import Optional, Sequence, Tuple
+from helpers.metrics import incr, gauge
+from LLM.tokens import count_tokens
+from LLM.structured import STRUCTURED_FORMAT_RULES, STRUCTURED_SYSTEM_PROMPT
+from config import PROMPT_CONTEXT_TOKENS
+
+TEXT_FORMAT_RULES = (
+    "Каждый день маршрута начинай с заголовка 'День N:', где N — номер дня.\n"
+    "Внутри каждого дня используй нумерацию достопримечательностей (1, 2, 3...) для удобства восприятия.\n"
+    "Для каждого пункта маршрута обязательно укажи полное название места и на отдельной строке его полный адрес в формате:\n"
+    "Адрес: <полный адрес, включая город и страну>\n"
+    "Если адрес определить невозможно, укажи примерный адрес (например, центр города).\n"
+    "В конце каждого дня маршрута обязательно добавь строку с координатами в формате:\n"
+    "Координаты: (lat, lon), (lat, lon), ...\n"
+    "Если координаты невозможно определить — всё равно вставь примерные (например, центр города), иначе маршрут не сработает.\n"
+    "Координаты критичны для построения карты. Без них маршрут будет считаться ошибочным!\n"
+    "Не используй markdown, жирный текст или хештеги.\n"
+)
+
+TEXT_SYSTEM_PROMPT = "Ты туристический консультант. Отвечай чистым текстом, без Markdown."
+
+ROUTE_RULES = (
+    "Составляй маршрут по параметрам поездки из сообщения пользователя.\n"
+    "Если пользователь впервые в городе — включай известные достопримечательности, например "
+    "Биг Бен для Лондона, Красная площадь для Москвы, Эйфелева Башня в Париже и дальше по аналогии. "
+    "Если уже был — предлагай менее туристические, интересные места.\n"
+    "Если указан бюджет, желательно тратить не менее 70% дневного бюджета: "
+    "предусмотри кафе, мероприятия, музеи или прогулки с затратами.\n"
+    "Если указана точка старта координатами (например, отель), начинай маршрут каждый день из неё: "
+    "первая точка маршрута всегда должна быть недалеко от неё.\n"
+    "Справочные места перечислены в порядке важности — в первую очередь используй их.\n"
+)
+
+
+def system_prompt(structured: bool = False) -> str:
+    """
+    Неизменный префикс запроса: зависит только от режима вывода.
+    """
+    if structured:
+        return f"{STRUCTURED_SYSTEM_PROMPT}\n\n{ROUTE_RULES}\n{STRUCTURED_FORMAT_RULES}"
+    return f"{TEXT_SYSTEM_PROMPT}\n\n{ROUTE_RULES}\n{TEXT_FORMAT_RULES}"
+
+
+def pack_context(places: list[dict], budget_tokens: int = PROMPT_CONTEXT_TOKENS, model: str = "gpt-3.5-turbo") -> str:
+    """
+    Справочный блок из мест с наибольшей оценкой, помещающихся в budget_tokens.
+    Место либо попадает в контекст целиком, либо не попадает совсем.
+    """
+    if not places:
+        return "В радиусе 2 км не найдено интересных объектов."
+    header = "Найденные места:"
+    used = count_tokens(header, model)
+    lines = []
+    ranked = sorted(places, key=lambda p: -(p.get("score") or 0))
+    for place in ranked:
+        line = f"{len(lines) + 1}. {place['name']}" + (f" — {place['info']}" if place.get("info") else "")
+        cost = count_tokens(line, model) + 1
+        if used + cost > budget_tokens:
+            continue
+        lines.append(line)
+        used += cost
+    gauge("prompt_context_tokens", used)
+    if len(lines) < len(ranked):
+        incr("prompt_context_places_dropped", len(ranked) - len(lines))
+    return header + "\n" + "\n".join(lines)
+
+
+def _days_word(days: int) -> str:
+    return "день" if days == 1 else "дня" if 2 <= days <= 4 else "дней"
+
+
+def user_prompt(
+    city_name: str,
+    preferences: list[str],
+    route_type: str,
+    days: int,
+    budget: float,
+    is_first_time: bool,
+    context: str,
+    start_coords: Optional[Tuple[float, float]] = None,
+    day: Optional[int] = None,
+    avoid: Sequence[str] = ()
+) -> str:
+    """
+    Изменяемая часть запроса: параметры поездки и справочные места.
+    Если задан day, запрос описывает только этот день поездки,
+    avoid — места, уже отданные другим дням.
+    """
+    if day is None:
+        lines = [
+            f"Составь маршрут из точки '{city_name}' на {days} {_days_word(days)}.",
+        ]
+    else:
+        lines = [
+            f"Составь маршрут на день {day} из {days} по городу '{city_name}'.",
+            f"Опиши только этот день и начни ответ с заголовка 'День {day}:'.",
+        ]
+    lines += [
+        f"Предпочтения: {', '.join(preferences)}. Тип маршрута: {route_type}.",
+        "Пользователь впервые в городе." if is_first_time else "Пользователь уже был в городе.",
+        "Укажи не менее 5 интересных мест в день." if days == 1
+        else "Для каждого дня предложи минимум 3 интересных места.",
+    ]
+    if budget > 0:
+        daily_budget = budget / days
+        if day is None:
+            lines.append(
+                f"Общий бюджет: {budget} рублей на {days} дн. (~{int(daily_budget)} руб/день, "
+                f"желательно от {int(daily_budget * 0.7)} руб/день)."
+            )
+        else:
+            lines.append(
+                f"Бюджет на этот день: ~{int(daily_budget)} руб. (желательно от {int(daily_budget * 0.7)} руб.)."
+            )
+    if start_coords:
+        lines.append(f"Точка старта (местоположение пользователя): {start_coords[0]}, {start_coords[1]}.")
+    if avoid:
+        lines.append(f"Эти места уже есть в другие дни, не повторяй их: {', '.join(avoid)}.")
+    lines.append(f"\nВот справочная информация:\n{context}")
+    return "\n".join(lines)
+
+
+def route_messages(user_content: str, structured: bool = False) -> list[dict]:
+    return [
+        {"role": "system", "content": system_prompt(structured)},
+        {"role": "user", "content": user_content},
+    ]
@@ -1,9 +1,11 @@
 from typing import List, Tuple, Optional
-from API.overpass_api import OverpassAPI
+from API.overpass_api import OverpassAPI, POI
+from API.poi_tile_cache import poi_tiles
 from API.osrm_api import OSRMAPI
 from API.nominatim_api import NominatimAPI
 from handlers.maps import generate_yandex_map_link
 from helpers.blacklist import load_blacklist
+from helpers.singleflight import SingleFlight
 
 PREFERENCE_MAP = {
     "музеи": ("tourism", "museum"),
@@ -25,10 +27,11 @@ PREFERENCE_MAP = {
 
 class RAGService:
     def __init__(self):
-        self.overpass   = OverpassAPI()
+        self.overpass   = OverpassAPI(tiles=poi_tiles)
         self.osrm       = OSRMAPI()
         self.nominatim = NominatimAPI()
         self.blacklist = load_blacklist()
+        self._flight = SingleFlight("rag_retrieve")
 
     def get_coordinates(self, location_name: str) -> Optional[Tuple[float, float]]:
         return self.nominatim.get_coordinates(location_name)
@@ -39,55 +42,82 @@ class RAGService:
         lon: float,
         preferences: List[str],
         default_pref: str = "достопримечательности"
-    ) -> List[dict]:
+    ) -> List[POI]:
+        """
+        Места по всем предпочтениям одним запросом к Overpass. Предпочтения
+        с одинаковым тегом (кафе, кофейни, bubble tea) дают один фильтр;
+        каждое место помечается предпочтением, по которому найдено.
+        """
         prefs = preferences or [default_pref]
-        all_candidates = []
-        for pref in prefs:
-            osm_key, osm_val = PREFERENCE_MAP.get(pref, ("tourism", "attraction"))
-            pois = self.overpass.find_popular_pois(lat, lon, osm_key, osm_val)
-            for el in pois:
-                name = el.get("tags", {}).get("name", "").lower()
-                if name and name not in self.blacklist:
-                    all_candidates.append(el)
+        pref_filters = [(pref, PREFERENCE_MAP.get(pref, ("tourism", "attraction"))) for pref in prefs]
+        grouped = self.overpass.find_popular_pois_batch(lat, lon, [f for _, f in pref_filters])
         seen = set()
         unique = []
-        for el in all_candidates:
-            name = el["tags"]["name"].lower()
-            if name not in seen:
+        for pref, osm_filter in pref_filters:
+            for poi in grouped[osm_filter]:
+                name = poi.name.lower()
+                if name in self.blacklist or name in seen:
+                    continue
                 seen.add(name)
-                unique.append(el)
+                poi.preference = pref
+                unique.append(poi)
         return unique
 
-    def build_context(self, pois: List[dict], user_coords: Tuple[float, float]) -> str:
-        if not pois:
-            return "В радиусе 2 км не найдено интересных объектов."
-        lines = []
-        for i, el in enumerate(pois[:20], 1):
-            tags = el.get("tags", {})
-            name = tags.get("name")
-            # Определяем координаты точки
-            coord = None
-            if el.get("type") == "node":
-                lat = el.get("lat")
-                lon = el.get("lon")
-                coord = (lat, lon) if lat is not None and lon is not None else None
-            else:
-                center = el.get("center") or {}
-                lat = center.get("lat")
-                lon = center.get("lon")
-                coord = (lat, lon) if lat is not None and lon is not None else None
-            if not coord:
-                continue
-
-            route = self.osrm.get_route(user_coords, coord)
+    def collect_places(self, pois: List[POI], user_coords: Tuple[float, float], limit: int = 20) -> List[dict]:
+        """
+        Места для контекста модели: название, координаты, расстояние и время пути
+        от точки пользователя и оценка важности из Overpass.
+        Берутся limit лучших по оценке (при равной — ближние) среди всех
+        предпочтений; расстояния до них запрашиваются у OSRM одним запросом.
+        """
+        ranked = sorted(pois, key=lambda poi: (-poi.score, poi.distance))[:limit]
+        table = self.osrm.get_table(user_coords, [poi.coords for poi in ranked])
+        if table is None:
+            table = [(None, None)] * len(ranked)
+        places = []
+        for poi, (dist, dur) in zip(ranked, table):
             info = ""
-            if route.get("routes"):
-                dist = route["routes"][0]["distance"] / 1000
-                dur  = route["routes"][0]["duration"] / 60
-                info = f"{dist:.1f} км, ~{dur:.0f} мин"
-            lines.append(f"{i}. {name} — {info}")
+            if dist is not None and dur is not None:
+                info = f"{dist / 1000:.1f} км, ~{dur / 60:.0f} мин"
+            places.append({"name": poi.name, "info": info, "score": poi.score, "lat": poi.lat, "lon": poi.lon})
+        return places
+
+    def build_context(self, pois: List[POI], user_coords: Tuple[float, float]) -> str:
+        places = self.collect_places(pois, user_coords)
+        if not places:
+            return "В радиусе 2 км не найдено интересных объектов."
+        lines = [f"{i}. {p['name']} — {p['info']}" for i, p in enumerate(places, 1)]
         return "Найденные места:\n" + "\n".join(lines)
 
+    @staticmethod
+    def _flight_key(kind: str, location_name, preferences, lat, lon) -> tuple:
+        return kind, (location_name or "").strip().lower(), tuple(sorted(preferences)), lat, lon
+
+    def retrieve_places(
+        self,
+        location_name: Optional[str],
+        preferences: List[str],
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
+    ) -> List[dict]:
+        """
+        То же, что retrieve_documents, но без форматирования:
+        список мест с оценками, чтобы контекст можно было упаковать по бюджету токенов.
+        Одинаковые одновременные запросы выполняются один раз.
+        """
+        key = self._flight_key("places", location_name, preferences, lat, lon)
+        return self._flight.do(key, self._retrieve_places, location_name, preferences, lat, lon)
+
+    def _retrieve_places(self, location_name, preferences, lat, lon) -> List[dict]:
+        if lat is not None and lon is not None:
+            coords = (lat, lon)
+        else:
+            coords = self.get_coordinates(location_name or "")
+            if not coords:
+                return []
+        pois = self.find_pois(coords[0], coords[1], preferences)
+        return self.collect_places(pois, coords)
+
     def retrieve_documents(
         self,
         location_name: Optional[str],
@@ -95,6 +125,10 @@ class RAGService:
         lat: Optional[float] = None,
         lon: Optional[float] = None
     ) -> str:
+        key = self._flight_key("documents", location_name, preferences, lat, lon)
+        return self._flight.do(key, self._retrieve_documents, location_name, preferences, lat, lon)
+
+    def _retrieve_documents(self, location_name, preferences, lat, lon) -> str:
         if lat is not None and lon is not None:
             coords = (lat, lon)
         else:
@@ -0,0 +1,137 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from helpers.metrics import incr
+from config import ROUTE_CACHE_PATH, ROUTE_CACHE_TTL, ROUTE_CACHE_MAX_ENTRIES, ROUTE_CACHE_GRID
+
+# Границы корзин бюджета, руб.: маршруты на 9 и 11 тысяч считаются одинаковыми
+BUDGET_BUCKETS = (0, 3000, 7000, 15000, 30000, 60000, 120000, 250000, 500000)
+
+
+def budget_bucket(budget: float) -> int:
+    bucket = 0
+    for i, bound in enumerate(BUDGET_BUCKETS):
+        if budget >= bound:
+            bucket = i
+    return bucket
+
+
+def snap_to_grid(value: float, grid: float = ROUTE_CACHE_GRID) -> str:
+    return f"{round(value / grid) * grid:.4f}"
+
+
+class RouteCache:
+    """
+    Дисковый кэш готовых маршрутов (SQLite) с TTL и вытеснением давно
+    не использовавшихся записей (LRU) при превышении max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str = ROUTE_CACHE_PATH,
+        ttl: float = ROUTE_CACHE_TTL,
+        max_entries: int = ROUTE_CACHE_MAX_ENTRIES
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS routes (
+                    key         TEXT PRIMARY KEY,
+                    value       TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS routes_last_access_idx ON routes (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(
+        lat: float,
+        lon: float,
+        preferences: list[str],
+        route_type: str,
+        days: int,
+        budget: float,
+        is_first_time: bool,
+        exact_start: bool = False
+    ) -> str:
+        """
+        Нормализованный ключ поездки: точка старта, привязанная к сетке,
+        отсортированные предпочтения, тип маршрута, дни, корзина бюджета,
+        первый ли визит и задана ли точка старта координатами.
+        """
+        normalized = [
+            snap_to_grid(lat), snap_to_grid(lon),
+            sorted({p.strip().lower() for p in preferences}),
+            route_type, int(days), budget_bucket(budget), bool(is_first_time), bool(exact_start)
+        ]
+        return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM routes WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM routes WHERE key = ?", (key,))
+                    conn.commit()
+                incr("route_cache_miss")
+                return None
+            conn.execute("UPDATE routes SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        incr("route_cache_hit")
+        return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO routes (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            conn.execute(
+                """
+                DELETE FROM routes WHERE key IN (
+                    SELECT key FROM routes ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def purge(self, expired_only: bool = False) -> int:
+        """
+        Удаляет все записи или только просроченные. Возвращает число удалённых.
+        """
+        with self._lock:
+            conn = self._connection()
+            if expired_only:
+                cursor = conn.execute("DELETE FROM routes WHERE created_at < ?", (time.time() - self.ttl,))
+            else:
+                cursor = conn.execute("DELETE FROM routes")
+            conn.commit()
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+
+route_cache = RouteCache()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+from LLM.llm import generate_route, is_route_error
+from LLM.itinerary import open_itinerary
+from LLM.memo import RouteMemo
+from LLM.prefetch import TripPrefetcher
+from keyboards.inline_keyboards import get_day_pager_keyboard, get_route_actions_keyboard
+from helpers.metrics import incr, gauge
+from helpers.message_streamer import MessageStreamer
+from config import (
+    ROUTE_WORKERS, ROUTE_QUEUE_SIZE, ROUTE_STREAMING, STREAM_EDIT_INTERVAL,
+    ROUTE_DAY_PAGING, TRIP_PREFETCH_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RouteQueueFull(Exception):
+    pass
+
+
+class RouteJobInProgress(Exception):
+    pass
+
+
+@dataclass
+class RouteJob:
+    """
+    Задание на построение маршрута.
+    params — аргументы generate_route, status — сообщение, которое
+    редактируется по мере продвижения задания, memo — контекст маршрута
+    для кнопки «Изменить маршрут», prefetch — фоновая загрузка контекста поездки.
+    """
+    user_id: int
+    chat_id: int
+    params: dict[str, Any]
+    status: Message
+    memo: Optional[RouteMemo] = None
+    prefetch: Optional[asyncio.Task] = None
+    stages: list[str] = field(default_factory=list)
+
+
+class RouteJobQueue:
+    """
+    Очередь построения маршрутов с ограниченным числом воркеров.
+    Хендлер ставит задание и сразу освобождается; воркер обновляет
+    статус-сообщение по этапам и отправляет готовый маршрут.
+    У пользователя одновременно может быть только одно задание.
+    """
+
+    def __init__(self, workers: int = ROUTE_WORKERS, max_size: int = ROUTE_QUEUE_SIZE):
+        self.workers = workers
+        self._queue: asyncio.Queue[RouteJob] = asyncio.Queue(maxsize=max_size)
+        self._active_users: set[int] = set()
+        self._busy = 0
+        self._tasks: list[asyncio.Task] = []
+        self._bot: Bot | None = None
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"route-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: RouteJob) -> int:
+        """
+        Ставит задание в очередь. Возвращает номер в очереди (0 — начнётся сразу).
+        """
+        if job.user_id in self._active_users:
+            raise RouteJobInProgress()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            incr("route_jobs_rejected")
+            raise RouteQueueFull()
+        self._active_users.add(job.user_id)
+        incr("route_jobs_submitted")
+        gauge("route_queue_size", self._queue.qsize())
+        # qsize — только ожидающие задания; свободные воркеры заберут первые из них
+        idle = self.workers - self._busy
+        return max(0, self._queue.qsize() - idle)
+
+    async def _update_status(self, job: RouteJob, stage: str):
+        job.stages.append(stage)
+        lines = [f"✅ {s}" for s in job.stages[:-1]] + [f"▶️ {job.stages[-1]}"]
+        try:
+            await job.status.edit_text("⏳ Строю маршрут\n\n" + "\n".join(lines))
+        except TelegramBadRequest:
+            pass
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._busy += 1
+            gauge("route_queue_size", self._queue.qsize())
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.exception(f"[ROUTE] Ошибка задания пользователя {job.user_id}: {e}")
+                await self._notify_error(job)
+            finally:
+                self._busy -= 1
+                self._active_users.discard(job.user_id)
+                self._queue.task_done()
+
+    async def _notify_error(self, job: RouteJob):
+        # Ошибка отправки (бот заблокирован, сеть) не должна останавливать воркер
+        try:
+            await self._bot.send_message(job.chat_id, "Ошибка при генерации маршрута. Попробуйте ещё раз")
+        except Exception as e:
+            logger.warning(f"[ROUTE] Не удалось сообщить об ошибке пользователю {job.user_id}: {e}")
+
+    async def _run(self, job: RouteJob):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        streamer = MessageStreamer(job.status, min_interval=STREAM_EDIT_INTERVAL)
+
+        async def progress(stage: str):
+            # после начала потока этапы выводятся строкой под черновиком
+            if streamer.started:
+                await streamer.set_footer(stage)
+            else:
+                await self._update_status(job, stage)
+
+        if job.prefetch and job.params.get("trip") is None:
+            trip = await TripPrefetcher.result(job.prefetch, TRIP_PREFETCH_TIMEOUT)
+            if trip:
+                job.params["trip"] = trip
+
+        on_draft = streamer.update if ROUTE_STREAMING else None
+        if ROUTE_DAY_PAGING and job.params.get("days", 1) > 1:
+            await self._run_paged(job, streamer, progress, on_draft)
+        else:
+            result = await generate_route(
+                **job.params,
+                progress=progress,
+                on_draft=on_draft,
+                on_trip=job.memo.remember if job.memo else None
+            )
+            await streamer.finish(
+                result,
+                parse_mode="HTML",
+                reply_markup=get_route_actions_keyboard() if job.memo and not is_route_error(result) else None
+            )
+        gauge("route_job_time", loop.time() - started)
+        incr("route_jobs_completed")
+
+    async def _run_paged(self, job: RouteJob, streamer: MessageStreamer, progress, on_draft):
+        """
+        Постраничный режим: строится и отправляется первый день с переключателем,
+        второй готовится в фоне, остальные — по запросу.
+        """
+        itinerary = await open_itinerary(job.user_id, **job.params, progress=progress)
+        if isinstance(itinerary, str):
+            await streamer.finish(itinerary, parse_mode="HTML")
+            return
+        if job.memo:
+            await job.memo.remember(itinerary.trip)
+        await progress("✍️ Составляю первый день")
+        text = await itinerary.day(1, on_draft=on_draft)
+        await streamer.finish(
+            text,
+            parse_mode="HTML",
+            reply_markup=get_day_pager_keyboard(itinerary.id, 1, itinerary.days)
+        )
+        itinerary.prefetch(2)
+
+route_queue = RouteJobQueue()
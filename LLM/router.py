@@ -0,0 +1,220 @@
+"""
+Маршрутизация запросов к LLM между моделями и эндпоинтами.
+
+Для каждой пары «модель@эндпоинт» хранится скользящее окно задержек.
+Если запрос идёт дольше порога (p95 окна, но не меньше LLM_HEDGE_MIN_DELAY),
+параллельно отправляется дублирующий запрос к следующей цели из цепочки;
+побеждает первый ответ, проигравший запрос отменяется. При сетевых ошибках,
+лимитах и ошибках 5xx запрос сразу уходит к следующей цели.
+"""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+from urllib.parse import urlparse
+import openai
+from helpers.metrics import incr, gauge
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых имеет смысл попробовать другую цель
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+@dataclass(frozen=True)
+class Target:
+    model: Optional[str]  # None — та же модель, что запрошена
+    base_url: Optional[str] = None  # None — основной эндпоинт
+
+    def resolve(self, model: str) -> "Target":
+        return Target(self.model or model, self.base_url)
+
+    @property
+    def label(self) -> str:
+        host = urlparse(self.base_url).netloc if self.base_url else "primary"
+        return f"{self.model}@{host}"
+
+
+def parse_targets(spec: str) -> list[Target]:
+    """
+    Разбирает цепочку резервных целей: «модель», «модель@url» или «@url»
+    (та же модель на другом эндпоинте), через запятую.
+    """
+    targets = []
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, base_url = item.partition("@")
+        targets.append(Target(model.strip() or None, base_url.strip() or None))
+    return targets
+
+
+class LatencyWindow:
+    def __init__(self, size: int):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI,
+        fallbacks: list[Target],
+        api_key: Optional[str] = None,
+        window: int = 200,
+        min_samples: int = 20,
+        hedge_percentile: float = 0.95,
+        hedge_min_delay: float = 2.0,
+        hedge_default_delay: float = 20.0
+    ):
+        self.client = client
+        self.fallbacks = fallbacks
+        self.api_key = api_key or client.api_key
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self._clients: dict[Optional[str], openai.AsyncOpenAI] = {None: client}
+        self._latency: dict[tuple[str, str], LatencyWindow] = {}
+
+    def _client(self, base_url: Optional[str]) -> openai.AsyncOpenAI:
+        if base_url not in self._clients:
+            self._clients[base_url] = openai.AsyncOpenAI(api_key=self.api_key, base_url=base_url)
+        return self._clients[base_url]
+
+    def targets(self, model: str) -> list[Target]:
+        chain = []
+        for target in [Target(model)] + self.fallbacks:
+            resolved = target.resolve(model)
+            if resolved not in chain:
+                chain.append(resolved)
+        return chain
+
+    def _window(self, kind: str, target: Target) -> LatencyWindow:
+        key = (kind, target.label)
+        if key not in self._latency:
+            self._latency[key] = LatencyWindow(self.window)
+        return self._latency[key]
+
+    def hedge_delay(self, kind: str, target: Target) -> float:
+        """
+        Сколько ждать ответа цели, прежде чем отправить дублирующий запрос.
+        """
+        window = self._window(kind, target)
+        if len(window.samples) < self.min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, window.percentile(self.hedge_percentile))
+
+    def _record(self, kind: str, target: Target, elapsed: float):
+        window = self._window(kind, target)
+        window.add(elapsed)
+        for q in (0.5, 0.95):
+            gauge(f"llm_{kind}_p{int(q * 100)}[{target.label}]", window.percentile(q))
+
+    def latency_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Текущие p50/p95 по каждой цели и виду запроса.
+        """
+        return {
+            f"{kind}:{label}": {
+                "p50": window.percentile(0.5),
+                "p95": window.percentile(0.95),
+                "samples": len(window.samples),
+            }
+            for (kind, label), window in self._latency.items()
+        }
+
+    async def _call(self, target: Target, stream: bool, params: dict) -> Any:
+        client = self._client(target.base_url)
+        if not stream:
+            return await client.chat.completions.create(model=target.model, **params)
+        response = await client.chat.completions.create(model=target.model, stream=True, **params)
+        try:
+            first = await response.__anext__()
+        except BaseException:
+            await self._close(response)
+            raise
+        return response, first
+
+    @staticmethod
+    async def _close(value: Any):
+        stream = value[0] if isinstance(value, tuple) else value
+        close = getattr(stream, "close", None)
+        if close:
+            try:
+                await close()
+            except Exception:
+                pass
+
+    async def create(self, model: str, stream: bool = False, **params) -> Any:
+        """
+        Аналог client.chat.completions.create с дублированием медленных
+        запросов и резервной цепочкой. При stream=True гонка идёт
+        до первого фрагмента ответа, возвращается поток победителя.
+        """
+        kind = "stream" if stream else "completion"
+        loop = asyncio.get_running_loop()
+        chain = self.targets(model)
+        next_index = 0
+        running: dict[asyncio.Task, tuple[Target, float]] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Target:
+            nonlocal next_index
+            target = chain[next_index]
+            next_index += 1
+            task = asyncio.create_task(self._call(target, stream, params))
+            running[task] = (target, loop.time())
+            return target
+
+        current = launch()
+        try:
+            while running:
+                timeout = self.hedge_delay(kind, current) if next_index < len(chain) else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    incr("llm_hedge_fired")
+                    logger.info(f"[LLM] {current.label} отвечает дольше {timeout:.1f} с, дублирую запрос")
+                    current = launch()
+                    continue
+                for task in done:
+                    target, started = running.pop(task)
+                    if task.exception() is None:
+                        self._record(kind, target, loop.time() - started)
+                        incr(f"llm_calls[{target.label}]")
+                        if target != chain[0]:
+                            incr("llm_hedge_won" if running else "llm_fallback_used")
+                        return self._wrap(task.result()) if stream else task.result()
+                    last_error = task.exception()
+                    incr(f"llm_errors[{target.label}]")
+                    logger.warning(f"[LLM] Ошибка {target.label}: {last_error}")
+                    if not running and next_index < len(chain) and isinstance(last_error, RETRYABLE_ERRORS):
+                        current = launch()
+            raise last_error
+        finally:
+            for task in running:
+                task.cancel()
+            for task in running:
+                try:
+                    await self._close(await task)
+                except BaseException:
+                    pass
+
+    @staticmethod
+    async def _wrap(value: tuple) -> AsyncIterator:
+        response, first = value
+        yield first
+        async for chunk in response:
+            yield chunk
@@ -0,0 +1,223 @@
+"""
+Структурированный режим генерации: модель за один запрос возвращает JSON
+с днями, точками, адресами и координатами, а текст для Telegram
+собирается локально. Второй (проверочный) запрос к модели не нужен.
+"""
+import re
+import json
+import html
+import math
+import openai
+from typing import Optional, Tuple
+from LLM.postprocess import geocode_cached, filter_duplicate_names
+from handlers.maps import generate_yandex_map_link, generate_yandex_map_link_from_names
+from helpers.metrics import incr
+from LLM.tokens import record_usage
+
+ROUTE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "days": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "day": {"type": "integer"},
+                    "stops": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "description": {"type": "string"},
+                                "address": {"type": "string"},
+                                "lat": {"type": "number"},
+                                "lon": {"type": "number"},
+                                "cost": {"type": "integer"},
+                            },
+                            "required": ["name", "description", "address", "lat", "lon", "cost"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["day", "stops"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["days"],
+    "additionalProperties": False,
+}
+
+STRUCTURED_FORMAT_RULES = (
+    "Ответ верни строго в формате JSON без пояснений:\n"
+    '{"days": [{"day": 1, "stops": [{"name": "...", "description": "...", '
+    '"address": "...", "lat": 0.0, "lon": 0.0, "cost": 0}]}]}\n'
+    "name — полное название места, description — одно-два предложения, чем оно интересно,\n"
+    "address — полный адрес с улицей, домом, городом и страной (если точный неизвестен — примерный),\n"
+    "lat/lon — координаты места (если неизвестны — примерные, например центр города),\n"
+    "cost — примерные затраты в рублях (0, если бесплатно).\n"
+)
+
+STRUCTURED_SYSTEM_PROMPT = "Ты туристический консультант. Отвечай только валидным JSON."
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _clean_stop(stop) -> Optional[dict]:
+    """
+    Приводит точку к типам ROUTE_SCHEMA: в режиме json_object схема
+    не соблюдается. Точка с нетекстовыми полями отбрасывается,
+    нечисловые затраты считаются нулевыми, координаты — неизвестными.
+    """
+    if not isinstance(stop, dict):
+        return None
+    name, description, address = (_text(stop.get(key)) for key in ("name", "description", "address"))
+    if name is None or description is None or address is None:
+        return None
+    cost = _number(stop.get("cost"))
+    return {
+        "name": name,
+        "description": description,
+        "address": address,
+        "lat": _number(stop.get("lat")),
+        "lon": _number(stop.get("lon")),
+        "cost": max(int(cost), 0) if cost is not None else 0,
+    }
+
+
+def parse_route_json(content: str) -> Optional[dict]:
+    """
+    Разбирает JSON-ответ модели (в том числе обёрнутый в ```json ... ```),
+    проверяет минимальную структуру и приводит точки к типам схемы;
+    невалидные точки пропускаются, дни без точек — тоже.
+    """
+    text = content.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, flags=re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    days = data.get("days") if isinstance(data, dict) else None
+    if not isinstance(days, list) or not days:
+        return None
+    cleaned = []
+    for day in days:
+        if not isinstance(day, dict) or not isinstance(day.get("stops"), list):
+            continue
+        stops = [stop for stop in map(_clean_stop, day["stops"]) if stop]
+        incr("structured_stop_invalid", len(day["stops"]) - len(stops))
+        if stops:
+            number = _number(day.get("day"))
+            cleaned.append({"day": int(number) if number is not None else 0, "stops": stops})
+    return {"days": cleaned} if cleaned else None
+
+
+async def request_structured_route(router, messages: list[dict], model: str, **params) -> Optional[dict]:
+    """
+    Запрашивает маршрут в виде JSON по схеме ROUTE_SCHEMA.
+    Если провайдер не поддерживает json_schema, повторяет запрос в режиме json_object.
+    """
+    try:
+        response = await router.create(
+            model=model,
+            messages=messages,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "route", "schema": ROUTE_SCHEMA, "strict": True},
+            },
+            **params
+        )
+    except openai.BadRequestError:
+        incr("structured_schema_unsupported")
+        response = await router.create(
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            **params
+        )
+    content = response.choices[0].message.content or ""
+    record_usage("structured", model, messages, content, getattr(response, "usage", None))
+    route = parse_route_json(content)
+    incr("structured_route_ok" if route else "structured_route_invalid")
+    return route
+
+
+def _stop_coords(stop: dict, city: str, country: str, geocodes: Optional[dict] = None) -> Optional[Tuple[float, float]]:
+    """
+    Координаты точки: геокодер по адресу, иначе координаты из ответа модели.
+    """
+    address = (stop.get("address") or "").strip()
+    if address:
+        coord = geocode_cached(address, city, country, geocodes)
+        if coord:
+            return coord
+    try:
+        lat, lon = float(stop["lat"]), float(stop["lon"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180 and (lat, lon) != (0.0, 0.0):
+        return lat, lon
+    return None
+
+
+def render_structured_route(
+    route: dict,
+    city: str,
+    country: str,
+    city_center: Tuple[float, float],
+    geocodes: Optional[dict] = None
+) -> str:
+    """
+    Собирает текст маршрута в том же виде, что и текстовый режим:
+    заголовки «День N:», нумерованные точки с адресами и ссылки на Яндекс.Карты.
+    route — результат parse_route_json (точки уже приведены к типам схемы).
+    """
+    result = ""
+    overall_addresses = []
+    for index, day in enumerate(sorted(route["days"], key=lambda d: d["day"]), 1):
+        lines = []
+        day_coords = [city_center]
+        for n, stop in enumerate(day["stops"], 1):
+            name = stop["name"] or "Без названия"
+            description = stop["description"]
+            address = stop["address"]
+            cost = stop["cost"]
+            lines.append(html.escape(f"{n}. {name}" + (f" — {description}" if description else ""), quote=False))
+            if address:
+                lines.append(html.escape(f"Адрес: {address}", quote=False))
+                overall_addresses.append(address)
+            if cost:
+                lines.append(f"Затраты: ~{cost} руб.")
+            coord = _stop_coords(stop, city, country, geocodes)
+            day_coords.append(coord or city_center)
+
+        day_body = "\n".join(lines)
+        day_link = generate_yandex_map_link(day_coords)
+        day_body += f"\n\n<a href='{day_link}'>Открыть маршрут</a>"
+        result += f"День {index}:\n{day_body}\n\n"
+
+    overall_addresses = filter_duplicate_names(overall_addresses)
+    overall_link = generate_yandex_map_link_from_names(overall_addresses, start_coords=city_center)
+    result += f"<a href='{overall_link}'>Открыть общий маршрут</a>"
+    return result.strip()
@@ -0,0 +1,59 @@
+"""
+Подсчёт токенов и учёт расхода токенов по этапам построения маршрута.
+"""
+from helpers.metrics import incr
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings: dict = {}
+
+
+def _encoding(model: str):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Число токенов в тексте. Без tiktoken — оценка по длине в байтах UTF-8:
+    у кириллицы на символ приходится больше токенов, чем у латиницы.
+    """
+    if not text:
+        return 0
+    if tiktoken is None:
+        return max(1, len(text.encode("utf-8")) // 4)
+    return len(_encoding(model).encode(text))
+
+
+def count_message_tokens(messages: list[dict], model: str = "gpt-3.5-turbo") -> int:
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def record_usage(stage: str, model: str, messages: list[dict], completion: str = "", usage=None):
+    """
+    Токены запроса и ответа по этапу: из usage ответа API, а если его нет
+    (например, при потоковом ответе) — по локальному подсчёту.
+    """
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        prompt_tokens = usage.prompt_tokens
+        completion_tokens = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+        if cached:
+            incr(f"llm_{stage}_cached_tokens", cached)
+    else:
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = count_tokens(completion, model)
+    incr(f"llm_{stage}_prompt_tokens", prompt_tokens)
+    incr(f"llm_{stage}_completion_tokens", completion_tokens)
+    incr(f"llm_{stage}_calls")
@@ -1,24 +1,55 @@
-import openai
 import re
-from loader import client
+import asyncio
+from loader import router
 from LLM.postprocess import enrich_route_with_coordinates
+from helpers.metrics import incr
+from LLM.tokens import record_usage
+
+MIN_STOPS_PER_DAY = 3
+
+STOP_LINE = re.compile(r"^\s*\d+\.\s+\S", flags=re.MULTILINE)
+ADDRESS_LINE = re.compile(r"^\s*Адрес:\s*\S", flags=re.MULTILINE | re.IGNORECASE)
+COORDS_LINE = re.compile(
+    r"^\s*Координаты:.*\(\s*-?\d+(?:\.\d+)?\s*,\s*-?\d+(?:\.\d+)?\s*\)",
+    flags=re.MULTILINE | re.IGNORECASE
+)
+MARKDOWN = re.compile(r"\*\*|__|^\s*#", flags=re.MULTILINE)
+
+VALIDATOR_SYSTEM_PROMPT = (
+    "Ты редактор туристических маршрутов. Пиши чистый текст и обязательно "
+    "добавляй адреса и координаты для каждой остановки."
+)
 
 def extract_day_blocks(text: str) -> list[tuple[str, str]]:
     blocks = re.split(r"(День\s+\d+:)", text)
     return [(blocks[i].strip(), blocks[i+1].strip()) for i in range(1, len(blocks), 2)]
 
-def validate_route_content(
-    route_text: str,
-    budget: float,
-    city: str,
-    country: str,
-    city_center: tuple[float, float],
-    model: str = "gpt-4-turbo"
-) -> str:
-    if not route_text.strip():
-        return "Ошибка: пустой маршрут."
+def day_conforms(day_body: str) -> bool:
+    """
+    Локальная проверка дня: не меньше MIN_STOPS_PER_DAY пронумерованных точек,
+    строка «Адрес:» на каждую точку, строка «Координаты:» с парами (lat, lon)
+    и отсутствие markdown.
+    """
+    stops = len(STOP_LINE.findall(day_body))
+    return (
+        stops >= MIN_STOPS_PER_DAY
+        and len(ADDRESS_LINE.findall(day_body)) >= stops
+        and bool(COORDS_LINE.search(day_body))
+        and not MARKDOWN.search(day_body)
+    )
 
-    prompt = (
+def find_nonconforming_days(route_text: str) -> list[int] | None:
+    """
+    Возвращает индексы дней, не прошедших проверку,
+    или None, если в тексте нет ни одного заголовка «День N:».
+    """
+    blocks = extract_day_blocks(route_text)
+    if not blocks:
+        return None
+    return [i for i, (_, body) in enumerate(blocks) if not day_conforms(body)]
+
+def repair_prompt(route_text: str, budget: float) -> str:
+    return (
         "Проверь и доработай туристический маршрут по следующим требованиям:\n"
         "1. Не используй markdown, жирный текст или хештеги.\n"
         "2. В каждом дне должно быть минимум 3–5 точек интереса.\n"
@@ -33,28 +64,82 @@ def validate_route_content(
         f"{route_text}"
     )
 
+async def repair_with_model(route_text: str, budget: float, model: str, max_tokens: int = 800) -> str:
+    messages = [
+        {"role": "system", "content": VALIDATOR_SYSTEM_PROMPT},
+        {"role": "user", "content": repair_prompt(route_text, budget)},
+    ]
+    response = await router.create(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=max_tokens,
+    )
+    content = response.choices[0].message.content.strip()
+    record_usage("validation", model, messages, content, response.usage)
+    return content
+
+async def repair_days(route_text: str, failing: list[int], budget: float, model: str) -> str:
+    """
+    Отправляет модели только дни, не прошедшие проверку (параллельно),
+    и подставляет исправленные версии на их места.
+    """
+    blocks = extract_day_blocks(route_text)
+
+    async def repair(index: int) -> str:
+        title, body = blocks[index]
+        repaired = await repair_with_model(f"{title}\n{body}", budget, model)
+        repaired_blocks = extract_day_blocks(repaired)
+        return repaired_blocks[0][1] if repaired_blocks else body
+
+    repaired_bodies = await asyncio.gather(*(repair(i) for i in failing))
+    for index, body in zip(failing, repaired_bodies):
+        blocks[index] = (blocks[index][0], body)
+    return "\n\n".join(f"{title}\n{body}" for title, body in blocks)
+
+async def validate_route_content(
+    route_text: str,
+    budget: float,
+    city: str,
+    country: str,
+    city_center: tuple[float, float],
+    model: str = "gpt-4-turbo",
+    geocodes: dict | None = None
+) -> str:
+    """
+    Доводит черновик до формата, нужного для построения карт.
+    Если черновик проходит локальную проверку, модель не вызывается;
+    если не проходят отдельные дни — модели отправляются только они.
+    """
+    if not route_text.strip():
+        return "Ошибка: пустой маршрут."
+
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Ты редактор туристических маршрутов. Пиши чистый текст и обязательно добавляй адреса и координаты для каждой остановки."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-            max_tokens=800,
-        )
-        validated_text = response.choices[0].message.content.strip()
+        failing = find_nonconforming_days(route_text)
+        if failing is None:
+            incr("validation_full")
+            validated_text = await repair_with_model(route_text, budget, model)
+        elif not failing:
+            incr("validation_skipped")
+            validated_text = route_text
+        else:
+            incr("validation_partial")
+            incr("validation_days_repaired", len(failing))
+            validated_text = await repair_days(route_text, failing, budget, model)
+
         day_blocks = extract_day_blocks(validated_text)
         for day_title, day_body in day_blocks:
             if not re.search(r"Адрес:\s*", day_body, flags=re.IGNORECASE):
                 return ("Ошибка: в маршруте отсутствуют адреса для остановок. "
                         "Убедитесь, что каждый пункт маршрута содержит строку 'Адрес: <полный адрес>'.")
 
-        enriched_text = enrich_route_with_coordinates(
+        enriched_text = await asyncio.to_thread(
+            enrich_route_with_coordinates,
             validated_text,
             city=city,
             country=country,
-            city_center=city_center
+            city_center=city_center,
+            geocodes=geocodes
         )
         final_output = ""
         for day_title, day_body in extract_day_blocks(enriched_text):
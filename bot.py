@@ -1,16 +1,26 @@
 import asyncio
+import logging
 from helpers.logger import setup_logging
 setup_logging(logfile="data/bot.log")
 
 from aiogram import F, types
 from aiogram.filters import Command, StateFilter
 from loader import dp, bot
-from handlers import start, routes, currency, info, parameters, feedback, fallback, admin
+from handlers import start, routes, currency, info, parameters, feedback, fallback, admin, itinerary, tweak
 from commands import set_bot_commands
-from middlewares.db_middleware import DatabaseMiddleware
+from middlewares.db_middleware import DatabaseMiddleware, activity_tracker
+from database.db import close_pool, apreload_admins
+from database.partitions import partition_maintainer
+from database.analytics_queue import analytics
+from LLM.route_queue import route_queue
 from states.travel_states import TravelForm
 
+logger = logging.getLogger(__name__)
+
 dp.message.register(start.welcome, Command("start"))
+dp.message.register(admin.export_data, Command("export"))
+dp.message.register(admin.purge_route_cache, Command("purge_route_cache"))
+dp.message.register(admin.llm_latency, Command("llm_latency"))
 
 dp.callback_query.register(routes.route_builder, F.data == "build_route")
 dp.callback_query.register(currency.currency_exchange, F.data == "currency_exchange")
@@ -18,6 +28,9 @@ dp.callback_query.register(info.bot_info, F.data == "bot_info")
 dp.callback_query.register(routes.confirm_routes_callback, F.data == "confirm_routes")
 dp.callback_query.register(start.back_to_main_callback, F.data == "back_to_main")
 dp.callback_query.register(feedback.feedback_handler, F.data == "feedback")
+dp.callback_query.register(itinerary.day_page_callback, F.data.startswith("day_page:"))
+dp.callback_query.register(tweak.tweak_menu, F.data == "tweak_route")
+dp.callback_query.register(tweak.tweak_option, F.data.startswith("tweak:"))
 dp.callback_query.register(
     routes.toggle_route_callback,
     (
@@ -33,12 +46,20 @@ dp.callback_query.register(admin.view_logs,      F.data == "view_logs")
 dp.callback_query.register(admin.clear_logs,     F.data == "clear_logs")
 dp.callback_query.register(admin.view_users,     F.data == "view_users")
 dp.callback_query.register(admin.make_admin,     F.data == "make_admin")
+dp.callback_query.register(admin.users_page_callback, F.data.startswith("users_page:"))
+dp.callback_query.register(admin.search_users,   F.data == "search_users")
+dp.callback_query.register(admin.export_help,    F.data == "export_help")
 
 dp.message.register(
     admin.process_set_admin,
     StateFilter(TravelForm.waiting_for_admin_id),
     F.content_type.in_(["text"])
 )
+dp.message.register(
+    admin.process_user_search,
+    StateFilter(TravelForm.waiting_for_user_search),
+    F.content_type.in_(["text"])
+)
 dp.message.register(
     parameters.process_location,
     StateFilter(TravelForm.waiting_for_location),
@@ -76,6 +97,24 @@ dp.callback_query.register(
     F.data == "confirm_cuisine",
     StateFilter(TravelForm.waiting_for_cuisine)
 )
+dp.message.register(
+    tweak.process_tweak_budget,
+    StateFilter(TravelForm.waiting_for_tweak_budget)
+)
+dp.message.register(
+    tweak.process_tweak_days,
+    StateFilter(TravelForm.waiting_for_tweak_days)
+)
+dp.callback_query.register(
+    parameters.toggle_cuisine,
+    F.data.startswith("toggle_cuisine"),
+    StateFilter(TravelForm.waiting_for_tweak_cuisine)
+)
+dp.callback_query.register(
+    tweak.confirm_tweak_cuisine,
+    F.data == "confirm_cuisine",
+    StateFilter(TravelForm.waiting_for_tweak_cuisine)
+)
 dp.callback_query.register(
     parameters.process_first_time,
     F.data.startswith("first_time:"),
@@ -97,7 +136,24 @@ async def main():
     dp.message.middleware(DatabaseMiddleware())
     dp.callback_query.middleware(DatabaseMiddleware())
     await set_bot_commands()
-    await dp.start_polling(bot)
+    # Без БД бот всё равно запускается: кэш админов не обязателен для старта,
+    # партиции создаёт фоновая задача и повторяет попытку сама
+    partition_maintainer.start()
+    try:
+        await apreload_admins()
+    except Exception as e:
+        logger.error(f"[DB] Не удалось прогреть кэш администраторов: {e}")
+    analytics.start()
+    activity_tracker.start()
+    route_queue.start(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await route_queue.stop()
+        await partition_maintainer.stop()
+        await activity_tracker.stop()
+        await analytics.stop()
+        close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -2,4 +2,77 @@ from helpers.config import get_env
 
 TOKEN          = get_env("TOKEN")
 API_KEY        = get_env("API_KEY")
-YANDEX_API_KEY = get_env("YANDEX_API_KEY")
\ No newline at end of file
+YANDEX_API_KEY = get_env("YANDEX_API_KEY")
+
+DB_POOL_MIN_SIZE        = int(get_env("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE        = int(get_env("DB_POOL_MAX_SIZE", "10"))
+DB_HEALTHCHECK_INTERVAL = float(get_env("DB_HEALTHCHECK_INTERVAL", "30"))
+
+
+ANALYTICS_BATCH_SIZE     = int(get_env("ANALYTICS_BATCH_SIZE", "200"))
+ANALYTICS_FLUSH_INTERVAL = float(get_env("ANALYTICS_FLUSH_INTERVAL", "5"))
+ANALYTICS_JOURNAL_PATH   = get_env("ANALYTICS_JOURNAL_PATH", "data/analytics_journal.jsonl")
+
+# Как часто проверять, что месячные партиции таблиц сессий созданы заранее, с
+PARTITION_CHECK_INTERVAL = float(get_env("PARTITION_CHECK_INTERVAL", str(24 * 3600)))
+
+ADMIN_CACHE_TTL = float(get_env("ADMIN_CACHE_TTL", "300"))
+
+USER_ACTIVITY_INTERVAL       = float(get_env("USER_ACTIVITY_INTERVAL", "300"))
+USER_ACTIVITY_FLUSH_INTERVAL = float(get_env("USER_ACTIVITY_FLUSH_INTERVAL", "30"))
+
+EXPORT_BATCH_SIZE = int(get_env("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_DIR        = get_env("EXPORT_DIR", "data/exports")
+
+ROUTE_WORKERS    = int(get_env("ROUTE_WORKERS", "4"))
+ROUTE_QUEUE_SIZE = int(get_env("ROUTE_QUEUE_SIZE", "100"))
+
+ROUTE_STREAMING      = get_env("ROUTE_STREAMING", "1") == "1"
+STREAM_EDIT_INTERVAL = float(get_env("STREAM_EDIT_INTERVAL", "1.0"))
+
+ROUTE_CACHE_PATH        = get_env("ROUTE_CACHE_PATH", "data/route_cache.sqlite3")
+ROUTE_CACHE_TTL         = float(get_env("ROUTE_CACHE_TTL", str(7 * 24 * 3600)))
+ROUTE_CACHE_MAX_ENTRIES = int(get_env("ROUTE_CACHE_MAX_ENTRIES", "5000"))
+ROUTE_CACHE_GRID        = float(get_env("ROUTE_CACHE_GRID", "0.01"))
+
+# text — черновик + проверка второй моделью, structured — один запрос с JSON-ответом
+ROUTE_OUTPUT_MODE = get_env("ROUTE_OUTPUT_MODE", "text")
+
+# Бюджет токенов на справочные места в запросе к модели
+PROMPT_CONTEXT_TOKENS = int(get_env("PROMPT_CONTEXT_TOKENS", "900"))
+
+# Многодневные маршруты: каждый день генерируется отдельным параллельным запросом
+ROUTE_PARALLEL_DAYS = get_env("ROUTE_PARALLEL_DAYS", "1") == "1"
+DAY_MAX_TOKENS      = int(get_env("DAY_MAX_TOKENS", "700"))
+
+# Резервные цели LLM через запятую: "модель", "модель@base_url" или "@base_url"
+LLM_FALLBACKS           = get_env("LLM_FALLBACKS", "")
+LLM_FALLBACK_API_KEY    = get_env("LLM_FALLBACK_API_KEY")
+LLM_HEDGE_PERCENTILE    = float(get_env("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY     = float(get_env("LLM_HEDGE_MIN_DELAY", "2"))
+LLM_HEDGE_DEFAULT_DELAY = float(get_env("LLM_HEDGE_DEFAULT_DELAY", "20"))
+
+# Постраничный многодневный маршрут: дни строятся по запросу пользователя
+ROUTE_DAY_PAGING = get_env("ROUTE_DAY_PAGING", "0") == "1"
+ITINERARY_TTL    = float(get_env("ITINERARY_TTL", str(24 * 3600)))
+
+# Сколько хранится контекст построенного маршрута для кнопки «Изменить маршрут»
+ROUTE_MEMO_TTL = float(get_env("ROUTE_MEMO_TTL", str(24 * 3600)))
+
+# Сколько ждать фоновую загрузку контекста поездки, начатую во время анкеты
+TRIP_PREFETCH_TTL     = float(get_env("TRIP_PREFETCH_TTL", "1800"))
+TRIP_PREFETCH_TIMEOUT = float(get_env("TRIP_PREFETCH_TIMEOUT", "30"))
+
+# Таймауты этапов подготовки маршрута, с
+GEOCODE_TIMEOUT         = float(get_env("GEOCODE_TIMEOUT", "15"))
+REVERSE_GEOCODE_TIMEOUT = float(get_env("REVERSE_GEOCODE_TIMEOUT", "15"))
+PLACES_TIMEOUT          = float(get_env("PLACES_TIMEOUT", "60"))
+
+# Общий кэш POI по тайлам geohash: свежесть и сколько ещё отдавать устаревшие тайлы, с
+POI_TILE_CACHE_PATH   = get_env("POI_TILE_CACHE_PATH", "data/poi_tiles.sqlite3")
+POI_TILE_PRECISION    = int(get_env("POI_TILE_PRECISION", "6"))
+POI_TILE_TTL          = float(get_env("POI_TILE_TTL", str(24 * 3600)))
+POI_TILE_MAX_STALE    = float(get_env("POI_TILE_MAX_STALE", str(30 * 24 * 3600)))
+# Не больше мест на тег в одном ответе Overpass и всего за одну загрузку тайлов
+POI_TILE_FETCH_LIMIT  = int(get_env("POI_TILE_FETCH_LIMIT", "200"))
+POI_TILE_MAX_ELEMENTS = int(get_env("POI_TILE_MAX_ELEMENTS", "3000"))
@@ -0,0 +1,194 @@
+import json
+import asyncio
+import logging
+from pathlib import Path
+import psycopg2
+from psycopg2.pool import PoolError
+from database.db import ANALYTICS_TABLES, asave_analytics_batch
+from helpers.metrics import incr
+from config import ANALYTICS_BATCH_SIZE, ANALYTICS_FLUSH_INTERVAL, ANALYTICS_JOURNAL_PATH
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых база считается недоступной и события уходят в журнал
+UNAVAILABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError)
+
+
+class AnalyticsWriter:
+    """
+    Фоновая запись аналитики (write-behind).
+    Хендлеры кладут события в буфер и не ждут БД; буфер сбрасывается
+    многострочными INSERT по размеру или по таймеру.
+    Если база недоступна, события дописываются в локальный журнал (JSON Lines)
+    и переигрываются при следующем успешном сбросе.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ANALYTICS_BATCH_SIZE,
+        flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+        journal_path: str = ANALYTICS_JOURNAL_PATH
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_path = Path(journal_path)
+        self._buffer: dict[str, list[tuple]] = {}
+        self._size = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def enqueue(self, table: str, *values):
+        """
+        Добавляет событие в буфер. Не блокирует и не обращается к БД.
+        """
+        columns = ANALYTICS_TABLES[table]
+        if len(values) != len(columns):
+            raise ValueError(f"{table}: ожидается {len(columns)} значений, получено {len(values)}")
+        self._buffer.setdefault(table, []).append(values)
+        self._size += 1
+        incr("analytics_events_enqueued")
+        if self._size >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="analytics-writer")
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и сбрасывает остаток буфера.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"[ANALYTICS] Ошибка фоновой записи: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            batches, self._buffer, self._size = self._buffer, {}, 0
+            if not await self._replay_journal():
+                if batches:
+                    await asyncio.to_thread(self._append_journal, batches)
+                return
+            if batches:
+                await self._write(batches)
+
+    @property
+    def rejected_path(self) -> Path:
+        return self.journal_path.with_suffix(self.journal_path.suffix + ".rejected")
+
+    async def _write(self, batches: dict[str, list[tuple]]):
+        count = sum(len(rows) for rows in batches.values())
+        try:
+            await asave_analytics_batch(batches)
+            incr("analytics_events_flushed", count)
+        except UNAVAILABLE_ERRORS as e:
+            logger.warning(f"[ANALYTICS] БД недоступна ({e}), {count} событий записано в журнал")
+            await asyncio.to_thread(self._append_journal, batches)
+        except psycopg2.Error as e:
+            logger.warning(f"[ANALYTICS] Пакет из {count} событий отклонён базой ({e}), пишу по таблицам")
+            await self._write_isolated(batches)
+
+    async def _write_isolated(self, batches: dict[str, list[tuple]]):
+        """
+        Пишет пакет по таблицам, а отклонённую таблицу — по строкам, чтобы
+        одна ошибочная строка не отменяла остальные. Строки, которые база
+        не принимает, уходят в файл .rejected; если база пропала по ходу,
+        незаписанный остаток — в журнал.
+        """
+        rejected: dict[str, list[tuple]] = {}
+        unsaved: dict[str, list[tuple]] = {}
+        for table, rows in batches.items():
+            if unsaved:
+                unsaved[table] = rows
+                continue
+            try:
+                await asave_analytics_batch({table: rows})
+                incr("analytics_events_flushed", len(rows))
+                continue
+            except UNAVAILABLE_ERRORS:
+                unsaved[table] = rows
+                continue
+            except psycopg2.Error:
+                pass
+            for i, row in enumerate(rows):
+                try:
+                    await asave_analytics_batch({table: [row]})
+                    incr("analytics_events_flushed")
+                except UNAVAILABLE_ERRORS:
+                    unsaved[table] = rows[i:]
+                    break
+                except psycopg2.Error as e:
+                    logger.error(f"[ANALYTICS] Строка {table} отклонена базой: {e}")
+                    rejected.setdefault(table, []).append(row)
+        if unsaved:
+            await asyncio.to_thread(self._append_journal, unsaved)
+        if rejected:
+            await asyncio.to_thread(self._append_journal, rejected, self.rejected_path)
+            incr("analytics_events_dropped", sum(len(rows) for rows in rejected.values()))
+
+    async def _replay_journal(self) -> bool:
+        """
+        Переигрывает журнал. Возвращает False, если база всё ещё недоступна.
+        """
+        if not self.journal_path.exists():
+            return True
+        batches = await asyncio.to_thread(self._read_journal)
+        count = sum(len(rows) for rows in batches.values())
+        try:
+            await asave_analytics_batch(batches)
+        except UNAVAILABLE_ERRORS:
+            return False
+        except psycopg2.Error as e:
+            logger.warning(f"[ANALYTICS] Журнал отклонён базой ({e}), переигрываю по таблицам")
+            self.journal_path.unlink(missing_ok=True)
+            await self._write_isolated(batches)
+            return True
+        self.journal_path.unlink(missing_ok=True)
+        incr("analytics_events_replayed", count)
+        logger.info(f"[ANALYTICS] Из журнала восстановлено {count} событий")
+        return True
+
+    def _append_journal(self, batches: dict[str, list[tuple]], path: Path | None = None):
+        path = path or self.journal_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for table, rows in batches.items():
+                for row in rows:
+                    f.write(json.dumps({"table": table, "row": list(row)}, ensure_ascii=False) + "\n")
+        if path == self.journal_path:
+            incr("analytics_events_journaled", sum(len(rows) for rows in batches.values()))
+
+    def _read_journal(self) -> dict[str, list[tuple]]:
+        batches: dict[str, list[tuple]] = {}
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("[ANALYTICS] Пропущена повреждённая строка журнала")
+                    continue
+                batches.setdefault(event["table"], []).append(tuple(event["row"]))
+        return batches
+
+
+analytics = AnalyticsWriter()
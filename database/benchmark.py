@@ -0,0 +1,252 @@
+"""
+Бенчмарк запросов database/db.py на синтетических данных.
+
+Создаёт отдельную схему (по умолчанию bench), применяет в ней миграции,
+заполняет её сгенерированными пользователями, сессиями и выборами,
+затем вызывает каждую функцию db.py, подменив курсор так, что каждый её запрос
+выполняется как EXPLAIN (ANALYZE, BUFFERS) и откатывается.
+
+    python -m database.benchmark --users 100000 --sessions-per-user 3
+    python -m database.benchmark --keep   # не удалять схему после прогона
+"""
+import time
+import argparse
+from contextlib import contextmanager
+from psycopg2.extras import DictCursor
+import database.db as db
+from database.migrate import migrate
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+ROUTE_TYPES = ["photo", "food"]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Нижний Новгород", "Координаты", "Екатеринбург", "Сочи"]
+CUISINES = ["Итальянская", "Русская", "Азиатская", "Фастфуд", "Вегетарианская", "Десерты", "Кофейни", "Bubble Tea"]
+PHOTO = ["Природные", "Городские пейзажи", "Памятники", "Музеи"]
+SEED_MONTHS = 6
+
+
+class _PlanRow(list):
+    """Подставляется вместо результата запроса: у плана нет колонок функции."""
+    def get(self, key, default=None):
+        return default
+
+
+class ExplainCursor:
+    """
+    Обёртка курсора: каждый execute превращается в EXPLAIN ANALYZE,
+    план сохраняется, а функции db.py получают пустой результат.
+    """
+    def __init__(self, cursor, plans: list):
+        self._cursor = cursor
+        self._plans = plans
+
+    def execute(self, sql, params=None):
+        prefix = EXPLAIN_PREFIX.encode() if isinstance(sql, bytes) else EXPLAIN_PREFIX
+        self._cursor.execute(prefix + sql, params)
+        self._plans.append(self._cursor.fetchone()[0][0])
+
+    def fetchone(self):
+        return _PlanRow([None])
+
+    def fetchall(self):
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def seed(cursor, users: int, sessions_per_user: int):
+    """
+    Заполняет схему синтетическими данными (всё генерируется на стороне сервера).
+    """
+    cursor.execute(
+        "SELECT create_monthly_partitions(t, (CURRENT_DATE - %s * INTERVAL '1 month')::date, %s) "
+        "FROM unnest(ARRAY['route_selections', 'location_data', 'photo_location_selections', "
+        "'cuisine_selections', 'route_parameters']) AS t",
+        (SEED_MONTHS, SEED_MONTHS + 1)
+    )
+    cursor.execute(
+        """
+        INSERT INTO users (user_id, username, first_name, first_seen, last_activity, is_admin)
+        SELECT g, 'user_' || g, 'Имя ' || g,
+               now() - random() * (%s * INTERVAL '1 month'), now(), g %% 1000 = 0
+        FROM generate_series(1, %s) AS g
+        """,
+        (SEED_MONTHS, users)
+    )
+    cursor.execute(
+        """
+        INSERT INTO sessions (user_id, start_time, completed)
+        SELECT u, now() - random() * (%s * INTERVAL '1 month'), random() < 0.6
+        FROM generate_series(1, %s) AS u, generate_series(1, %s)
+        """,
+        (SEED_MONTHS, users, sessions_per_user)
+    )
+    cursor.execute(
+        """
+        INSERT INTO route_selections (session_id, route_type, selected, created_at)
+        SELECT s.session_id, rt, random() < 0.5, s.start_time
+        FROM sessions s, unnest(%s::text[]) AS rt
+        """,
+        (ROUTE_TYPES,)
+    )
+    cursor.execute(
+        """
+        INSERT INTO location_data (session_id, departure_city, lat, lon, created_at)
+        SELECT s.session_id, (%s::text[])[1 + floor(random() * %s)::int],
+               55 + random(), 37 + random(), s.start_time
+        FROM sessions s
+        """,
+        (CITIES, len(CITIES))
+    )
+    cursor.execute(
+        """
+        INSERT INTO cuisine_selections (session_id, cuisine_type, created_at)
+        SELECT s.session_id, c, s.start_time
+        FROM sessions s, unnest(%s::text[]) AS c
+        WHERE random() < 0.3
+        """,
+        (CUISINES,)
+    )
+    cursor.execute(
+        """
+        INSERT INTO photo_location_selections (session_id, photo_location_type, created_at)
+        SELECT s.session_id, p, s.start_time
+        FROM sessions s, unnest(%s::text[]) AS p
+        WHERE random() < 0.4
+        """,
+        (PHOTO,)
+    )
+    cursor.execute(
+        """
+        INSERT INTO route_parameters (session_id, budget, days, created_at)
+        SELECT s.session_id, round((random() * 50000)::numeric, 2), 1 + floor(random() * 7)::int, s.start_time
+        FROM sessions s
+        """
+    )
+    cursor.execute("SELECT analytics_rebuild_rollups()")
+    cursor.execute("ANALYZE")
+
+
+def benchmark_calls(users: int) -> list[tuple[str, callable]]:
+    """
+    Все функции db.py, которые выполняют запросы через get_cursor.
+    """
+    uid = max(1, users // 2)
+    return [
+        ("check_health", lambda: db.check_health()),
+        ("save_feedback", lambda: db.save_feedback(uid, "отзыв")),
+        ("register_user", lambda: db.register_user(uid, "user", "Имя", None)),
+        ("touch_users", lambda: db.touch_users({uid: 1.5, uid + 1: 3.0})),
+        ("start_session", lambda: db.start_session(uid)),
+        ("complete_session", lambda: db.complete_session(1)),
+        ("save_route_selection", lambda: db.save_route_selection(1, "photo", True)),
+        ("save_location", lambda: db.save_location(1, "Москва", 55.75, 37.61)),
+        ("save_photo_location", lambda: db.save_photo_location(1, "Музеи")),
+        ("save_cuisine", lambda: db.save_cuisine(1, "Русская")),
+        ("save_route_parameters", lambda: db.save_route_parameters(1, 10000, 2)),
+        ("save_analytics_batch", lambda: db.save_analytics_batch({
+            "cuisine_selections": [(1, "Русская")] * 100,
+            "route_selections": [(1, "food", True)] * 100,
+        })),
+        ("get_popular_routes", lambda: db.get_popular_routes()),
+        ("get_completion_stats", lambda: db.get_completion_stats()),
+        ("get_user_stats_by_period(day)", lambda: db.get_user_stats_by_period("day")),
+        ("get_user_stats_by_period(week)", lambda: db.get_user_stats_by_period("week")),
+        ("get_popular_cuisines", lambda: db.get_popular_cuisines()),
+        ("get_popular_photo_locations", lambda: db.get_popular_photo_locations()),
+        ("get_popular_departure_cities", lambda: db.get_popular_departure_cities()),
+        ("is_user_admin", lambda: db._fetch_user_admin(uid)),
+        ("set_user_admin", lambda: db.set_user_admin(uid, True)),
+        ("preload_admins", lambda: db.preload_admins()),
+        ("get_all_users", lambda: db.get_all_users()),
+        ("get_users_page(first)", lambda: db.get_users_page(limit=20)),
+        ("get_users_page(after)", lambda: db.get_users_page(after=("2100-01-01", 0), limit=20)),
+        ("get_users_page(prefix)", lambda: db.get_users_page(limit=20, username_prefix="user_12")),
+    ]
+
+
+@contextmanager
+def explain_cursors(conn, plans: list):
+    """
+    Подменяет db.get_cursor: запросы идут в одно соединение схемы бенчмарка
+    и откатываются после каждого вызова.
+    """
+    original = db.get_cursor
+
+    @contextmanager
+    def get_cursor(commit: bool = False):
+        cursor = conn.cursor(cursor_factory=DictCursor)
+        try:
+            yield ExplainCursor(cursor, plans)
+        finally:
+            cursor.close()
+            conn.rollback()
+
+    db.get_cursor = get_cursor
+    try:
+        yield
+    finally:
+        db.get_cursor = original
+
+
+def run(conn, users: int) -> list[tuple[str, float, float, str]]:
+    results = []
+    for name, call in benchmark_calls(users):
+        plans: list = []
+        with explain_cursors(conn, plans):
+            try:
+                call()
+            except Exception as e:
+                conn.rollback()
+                results.append((name, 0.0, 0.0, f"ошибка: {e}"))
+                continue
+        for plan in plans:
+            node = plan["Plan"]
+            results.append((
+                name,
+                plan.get("Planning Time", 0.0),
+                plan.get("Execution Time", 0.0),
+                node.get("Node Type", "")
+            ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE для запросов database/db.py")
+    parser.add_argument("--schema", default="bench", help="схема для синтетических данных")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--sessions-per-user", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после прогона")
+    args = parser.parse_args()
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE')
+            cursor.execute(f'CREATE SCHEMA "{args.schema}"')
+        conn.commit()
+        try:
+            migrate(conn, schema=args.schema)
+            started = time.time()
+            with conn.cursor() as cursor:
+                seed(cursor, args.users, args.sessions_per_user)
+            conn.commit()
+            print(f"Данные сгенерированы за {time.time() - started:.1f} с "
+                  f"({args.users} пользователей, {args.users * args.sessions_per_user} сессий)\n")
+
+            print(f"{'Запрос':<34} {'План, мс':>10} {'Выполнение, мс':>16}  Верхний узел")
+            for name, planning, execution, node in run(conn, args.users):
+                print(f"{name:<34} {planning:>10.3f} {execution:>16.3f}  {node}")
+        finally:
+            conn.rollback()
+            if not args.keep:
+                with conn.cursor() as cursor:
+                    cursor.execute(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE')
+                conn.commit()
+            with conn.cursor() as cursor:
+                cursor.execute("RESET search_path")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,101 @@
 import time
+import asyncio
 import logging
+import functools
+import threading
+import uuid
+from datetime import datetime
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2 import pool
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.extensions import STATUS_READY
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from database.db_config import DB_CONFIG
+from config import DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_HEALTHCHECK_INTERVAL, ADMIN_CACHE_TTL
+from helpers.cache import TTLCache
+from helpers.metrics import incr
 
 logger = logging.getLogger(__name__)
 
+_pool: pool.ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool бросает PoolError при исчерпании, семафор заставляет ждать свободное соединение
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_last_used: dict[int, float] = {}
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="db")
+_admin_cache = TTLCache(ttl=ADMIN_CACHE_TTL)
+# Меняется при каждом set_user_admin: чтение из БД, начатое раньше, не попадает в кэш
+_admin_generation = 0
+_admin_lock = threading.Lock()
+
+
+def _get_pool() -> pool.ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, **DB_CONFIG)
+                logger.info(f"[DB] Пул соединений создан ({DB_POOL_MIN_SIZE}..{DB_POOL_MAX_SIZE})")
+    return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """
+    Проверяет соединение перед выдачей из пула.
+    Свежие и недавно использованные соединения не пингуются.
+    """
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _release(db_pool, conn, broken: bool = False):
+    close = broken or conn.closed
+    if not close and conn.status != STATUS_READY:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            close = True
+    if close:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    db_pool.putconn(conn, close=close)
+
+
 @contextmanager
 def get_connection():
-    """Контекстный менеджер для соединения с БД"""
-    conn = psycopg2.connect(**DB_CONFIG)
+    """Контекстный менеджер для соединения из пула"""
+    _pool_slots.acquire()
     try:
-        yield conn
+        db_pool = _get_pool()
+        conn = db_pool.getconn()
+        if not _is_healthy(conn):
+            logger.warning("[DB] Соединение из пула не прошло проверку, переподключаемся")
+            _release(db_pool, conn, broken=True)
+            conn = db_pool.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _release(db_pool, conn, broken=True)
+            raise
+        except BaseException:
+            _release(db_pool, conn)
+            raise
+        else:
+            _release(db_pool, conn)
     finally:
-        conn.close()
+        _pool_slots.release()
 
 @contextmanager
 def get_cursor(commit: bool = False):
@@ -35,6 +116,76 @@ def get_cursor(commit: bool = False):
             logger.info(f"[DB] Запрос выполнен за {elapsed:.4f} секунд")
 
 
+@contextmanager
+def stream_query(sql: str, params: tuple = (), batch_size: int = 1000):
+    """
+    Выполняет запрос через именованный (серверный) курсор.
+    Возвращает (имена колонок, генератор пачек по batch_size строк):
+    в памяти одновременно находится не больше одной пачки.
+    """
+    with get_connection() as conn:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=DictCursor) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(sql, params)
+            first = cursor.fetchmany(batch_size)
+            columns = [col.name for col in cursor.description or []]
+
+            def batches():
+                batch = first
+                while batch:
+                    yield batch
+                    batch = cursor.fetchmany(batch_size)
+
+            yield columns, batches()
+        conn.rollback()
+
+
+def check_health() -> bool:
+    """
+    Проверка доступности базы: SELECT 1 через пул.
+    """
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("SELECT 1")
+            return cursor.fetchone()[0] == 1
+    except psycopg2.Error as e:
+        logger.error(f"[DB] Проверка здоровья не пройдена: {e}")
+        return False
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+    _executor.shutdown(wait=False)
+
+
+def ensure_session_partitions(months_ahead: int = 3):
+    """
+    Создаёт месячные партиции таблиц сессий на months_ahead месяцев вперёд
+    (функция из миграции 0001; партиционированные таблицы создаёт 0002,
+    DEFAULT-партиции и перенос строк из них — 0005).
+    """
+    with get_cursor(commit=True) as cursor:
+        cursor.execute("SELECT ensure_session_partitions(%s)", (months_ahead,))
+
+
+def _async(func):
+    """
+    Асинхронная версия функции: запрос выполняется в потоках БД,
+    event loop не блокируется. Потоков столько же, сколько соединений в пуле.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    wrapper.__name__ = wrapper.__qualname__ = f"a{func.__name__}"
+    return wrapper
+
+
 def save_feedback(user_id, feedback_text):
     with get_cursor(commit=True) as cursor:
         cursor.execute(
@@ -70,6 +221,28 @@ def register_user(user_id, username=None, first_name=None, last_name=None):
     return user
 
 
+def touch_users(idle_seconds: dict[int, float]):
+    """
+    Пакетно обновляет last_activity. Значение — сколько секунд назад
+    пользователь был активен, чтобы не зависеть от часового пояса сервера.
+    """
+    if not idle_seconds:
+        return
+    with get_cursor(commit=True) as cursor:
+        execute_values(
+            cursor,
+            """
+            UPDATE users
+            SET last_activity = CURRENT_TIMESTAMP - make_interval(secs => v.idle)
+            FROM (VALUES %s) AS v(user_id, idle)
+            WHERE users.user_id = v.user_id
+            """,
+            list(idle_seconds.items()),
+            template="(%s::bigint, %s::double precision)",
+            page_size=len(idle_seconds)
+        )
+
+
 def start_session(user_id):
     with get_cursor(commit=True) as cursor:
         cursor.execute(
@@ -160,17 +333,47 @@ def save_route_parameters(session_id, budget, days):
             (session_id, budget, days)
         )
 
+ANALYTICS_TABLES = {
+    "route_selections": ("session_id", "route_type", "selected"),
+    "location_data": ("session_id", "departure_city", "lat", "lon"),
+    "photo_location_selections": ("session_id", "photo_location_type"),
+    "cuisine_selections": ("session_id", "cuisine_type"),
+    "route_parameters": ("session_id", "budget", "days"),
+}
+
+def save_analytics_batch(batches: dict[str, list[tuple]]) -> int:
+    """
+    Пакетная запись аналитических событий: один многострочный INSERT на таблицу,
+    все таблицы в одной транзакции.
+
+    :param batches: {имя таблицы из ANALYTICS_TABLES: [кортежи значений колонок]}
+    :return: количество записанных строк
+    """
+    total = 0
+    with get_cursor(commit=True) as cursor:
+        for table, rows in batches.items():
+            if not rows:
+                continue
+            columns = ANALYTICS_TABLES[table]
+            execute_values(
+                cursor,
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+                rows,
+                page_size=len(rows)
+            )
+            total += len(rows)
+    return total
+
 def get_popular_routes(limit=10):
     """
     Returns the most frequently chosen route types.
+    Reads the analytics_route_counts rollup (see analytics_views.sql).
     """
     with get_cursor() as cursor:
         cursor.execute(
             """
-            SELECT route_type, COUNT(*) as count
-            FROM route_selections
-            WHERE selected = TRUE
-            GROUP BY route_type
+            SELECT route_type, count
+            FROM analytics_route_counts
             ORDER BY count DESC
             LIMIT %s;
             """,
@@ -181,15 +384,15 @@ def get_popular_routes(limit=10):
 def get_completion_stats():
     """
     Returns statistics about session completion rates.
+    Reads the analytics_session_counts rollup.
     """
     with get_cursor() as cursor:
         cursor.execute(
             """
             SELECT 
-                COUNT(*) as completed_sessions, 
-                COUNT(*) * 100.0 / (SELECT COUNT(*) FROM sessions) as completion_percentage
-            FROM sessions
-            WHERE completed = TRUE;
+                completed as completed_sessions, 
+                completed * 100.0 / NULLIF(total, 0) as completion_percentage
+            FROM analytics_session_counts;
             """
         )
         return cursor.fetchone()
@@ -197,17 +400,18 @@ def get_completion_stats():
 def get_user_stats_by_period(period='day', limit=30):
     """
     Returns user statistics aggregated by the specified period.
+    Weekly figures are summed from the analytics_daily_new_users rollup.
     
     :param period: 'day' or 'week'
     :param limit: Number of most recent periods to return
     """
-    period_sql = "DATE(first_seen)" if period == 'day' else "DATE_TRUNC('week', first_seen)"
+    period_sql = "day" if period == 'day' else "DATE_TRUNC('week', day::timestamp)"
     
     with get_cursor() as cursor:
         cursor.execute(
             f"""
-            SELECT {period_sql} as period, COUNT(*) as new_users
-            FROM users
+            SELECT {period_sql} as period, SUM(new_users)::bigint as new_users
+            FROM analytics_daily_new_users
             GROUP BY period
             ORDER BY period DESC
             LIMIT %s;
@@ -223,9 +427,8 @@ def get_popular_cuisines(limit=10):
     with get_cursor() as cursor:
         cursor.execute(
             """
-            SELECT cuisine_type, COUNT(*) as count
-            FROM cuisine_selections
-            GROUP BY cuisine_type
+            SELECT cuisine_type, count
+            FROM analytics_cuisine_counts
             ORDER BY count DESC
             LIMIT %s;
             """,
@@ -240,9 +443,8 @@ def get_popular_photo_locations(limit=10):
     with get_cursor() as cursor:
         cursor.execute(
             """
-            SELECT photo_location_type, COUNT(*) as count
-            FROM photo_location_selections
-            GROUP BY photo_location_type
+            SELECT photo_location_type, count
+            FROM analytics_photo_location_counts
             ORDER BY count DESC
             LIMIT %s;
             """,
@@ -257,9 +459,8 @@ def get_popular_departure_cities(limit=10):
     with get_cursor() as cursor:
         cursor.execute(
             """
-            SELECT departure_city, COUNT(*) as count
-            FROM location_data
-            GROUP BY departure_city
+            SELECT departure_city, count
+            FROM analytics_departure_city_counts
             ORDER BY count DESC
             LIMIT %s;
             """,
@@ -268,22 +469,68 @@ def get_popular_departure_cities(limit=10):
         return cursor.fetchall()
 
 
-def is_user_admin(user_id: int) -> bool:
+def _cached_admin_flag(user_id: int) -> bool | None:
+    flag = _admin_cache.get(user_id)
+    incr("admin_cache_hit" if flag is not None else "admin_cache_miss")
+    return flag
+
+
+def _fill_admin_cache(flags: dict[int, bool], generation: int):
+    with _admin_lock:
+        if generation == _admin_generation:
+            for user_id, flag in flags.items():
+                _admin_cache.set(user_id, flag)
+
+
+def _fetch_user_admin(user_id: int) -> bool:
+    generation = _admin_generation
     with get_cursor() as cursor:
         cursor.execute(
             "SELECT is_admin FROM users WHERE user_id = %s",
             (user_id,)
         )
         result = cursor.fetchone()
-    return bool(result and result.get("is_admin", False))
+    flag = bool(result and result.get("is_admin", False))
+    _fill_admin_cache({user_id: flag}, generation)
+    return flag
+
+
+def is_user_admin(user_id: int) -> bool:
+    """
+    Проверка прав администратора. Флаг кэшируется на ADMIN_CACHE_TTL секунд.
+    """
+    flag = _cached_admin_flag(user_id)
+    if flag is not None:
+        return flag
+    return _fetch_user_admin(user_id)
 
 
 def set_user_admin(target_user_id: int, is_admin: bool = True):
+    """
+    Меняет флаг администратора и сбрасывает его в кэше; незавершённые
+    чтения флага из БД после этого в кэш не пишутся.
+    """
+    global _admin_generation
     with get_cursor(commit=True) as cursor:
         cursor.execute(
             "UPDATE users SET is_admin = %s WHERE user_id = %s",
             (is_admin, target_user_id)
         )
+    with _admin_lock:
+        _admin_generation += 1
+        _admin_cache.invalidate(target_user_id)
+
+
+def preload_admins() -> int:
+    """
+    Прогревает кэш флагами всех администраторов. Возвращает их количество.
+    """
+    generation = _admin_generation
+    with get_cursor() as cursor:
+        cursor.execute("SELECT user_id FROM users WHERE is_admin = TRUE")
+        admin_ids = [row[0] for row in cursor.fetchall()]
+    _fill_admin_cache(dict.fromkeys(admin_ids, True), generation)
+    return len(admin_ids)
 
 
 def get_all_users(limit: int = 100):
@@ -297,4 +544,98 @@ def get_all_users(limit: int = 100):
             """,
             (limit,)
         )
-        return cursor.fetchall()
\ No newline at end of file
+        return cursor.fetchall()
+
+
+
+def _page_key(key) -> tuple:
+    first_seen, user_id = key
+    if isinstance(first_seen, str):
+        first_seen = datetime.fromisoformat(first_seen)
+    return first_seen, user_id
+
+
+def get_users_page(
+    after: tuple | None = None,
+    before: tuple | None = None,
+    limit: int = 20,
+    username_prefix: str | None = None
+):
+    """
+    Keyset-пагинация пользователей по (first_seen, user_id), новые сверху.
+
+    :param after: ключ (first_seen, user_id) последней строки текущей страницы — следующая страница;
+        first_seen — datetime или строка ISO 8601
+    :param before: ключ первой строки текущей страницы — предыдущая страница
+    :param limit: размер страницы
+    :param username_prefix: фильтр по началу username (без учёта регистра)
+    :return: (строки страницы, есть ли ещё строки в направлении листания)
+    """
+    conditions = []
+    params: list = []
+    if username_prefix:
+        escaped = username_prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("lower(username) LIKE %s")
+        params.append(escaped + "%")
+    if after is not None:
+        conditions.append("(first_seen, user_id) < (%s, %s)")
+        params.extend(_page_key(after))
+    elif before is not None:
+        conditions.append("(first_seen, user_id) > (%s, %s)")
+        params.extend(_page_key(before))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ASC" if before is not None and after is None else "DESC"
+
+    with get_cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT user_id, username, first_name, last_name, is_admin, first_seen
+            FROM users
+            {where}
+            ORDER BY first_seen {order}, user_id {order}
+            LIMIT %s
+            """,
+            (*params, limit + 1)
+        )
+        rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "ASC":
+        rows.reverse()
+    return rows, has_more
+
+# Асинхронный API для хендлеров и middleware
+acheck_health = _async(check_health)
+aensure_session_partitions = _async(ensure_session_partitions)
+asave_feedback = _async(save_feedback)
+aregister_user = _async(register_user)
+atouch_users = _async(touch_users)
+astart_session = _async(start_session)
+acomplete_session = _async(complete_session)
+asave_route_selection = _async(save_route_selection)
+asave_location = _async(save_location)
+asave_photo_location = _async(save_photo_location)
+asave_cuisine = _async(save_cuisine)
+asave_route_parameters = _async(save_route_parameters)
+asave_analytics_batch = _async(save_analytics_batch)
+aget_popular_routes = _async(get_popular_routes)
+aget_completion_stats = _async(get_completion_stats)
+aget_user_stats_by_period = _async(get_user_stats_by_period)
+aget_popular_cuisines = _async(get_popular_cuisines)
+aget_popular_photo_locations = _async(get_popular_photo_locations)
+aget_popular_departure_cities = _async(get_popular_departure_cities)
+apreload_admins = _async(preload_admins)
+_afetch_user_admin = _async(_fetch_user_admin)
+aset_user_admin = _async(set_user_admin)
+aget_all_users = _async(get_all_users)
+aget_users_page = _async(get_users_page)
+
+
+async def ais_user_admin(user_id: int) -> bool:
+    """
+    Асинхронная проверка прав: при попадании в кэш обходится без пула потоков.
+    """
+    flag = _cached_admin_flag(user_id)
+    if flag is not None:
+        return flag
+    return await _afetch_user_admin(user_id)
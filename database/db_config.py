@@ -0,0 +1,9 @@
+from pathlib import Path
+from dotenv import load_dotenv
+from helpers.config import get_env
+
+env_path = Path(__file__).parent.parent / "db.env"
+if env_path.exists():
+    load_dotenv(env_path)
+
+DB_CONFIG = {"dsn": get_env("DATABASE_URL")}
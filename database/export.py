@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+from database.db import stream_query
+from helpers.file_utils import write_csv_stream, write_jsonl_stream
+from config import EXPORT_BATCH_SIZE, EXPORT_DIR
+
+EXPORT_TABLES = [
+    "users", "sessions", "feedback",
+    "route_selections", "location_data", "photo_location_selections",
+    "cuisine_selections", "route_parameters",
+]
+
+# Те же агрегаты, что отдают get_popular_*, только без LIMIT
+EXPORT_QUERIES = {
+    "popular_routes": "SELECT route_type, count FROM analytics_route_counts ORDER BY count DESC",
+    "popular_cuisines": "SELECT cuisine_type, count FROM analytics_cuisine_counts ORDER BY count DESC",
+    "popular_photo_locations": "SELECT photo_location_type, count FROM analytics_photo_location_counts ORDER BY count DESC",
+    "popular_departure_cities": "SELECT departure_city, count FROM analytics_departure_city_counts ORDER BY count DESC",
+}
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def export_sources() -> list[str]:
+    return EXPORT_TABLES + list(EXPORT_QUERIES)
+
+
+def export_to_file(source: str, fmt: str = "csv", batch_size: int = EXPORT_BATCH_SIZE) -> tuple[Path, int]:
+    """
+    Выгружает таблицу аналитики или результат get_popular_* в CSV / JSON Lines.
+    Строки читаются серверным курсором пачками и сразу пишутся в файл,
+    поэтому расход памяти не зависит от размера выгрузки.
+    Возвращает (путь к файлу, количество строк).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    if source in EXPORT_QUERIES:
+        sql = EXPORT_QUERIES[source]
+    elif source in EXPORT_TABLES:
+        sql = f"SELECT * FROM {source}"
+    else:
+        raise ValueError(f"Неизвестный источник: {source}")
+
+    path = Path(EXPORT_DIR) / f"{source}_{time.strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    with stream_query(sql, batch_size=batch_size) as (columns, batches):
+        rows = ([dict(row) for row in batch] for batch in batches)
+        if fmt == "csv":
+            count = write_csv_stream(str(path), rows, columns)
+        else:
+            count = write_jsonl_stream(str(path), rows)
+    return path, count
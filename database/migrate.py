@@ -0,0 +1,109 @@
+"""
+Версионные миграции схемы.
+
+Файлы database/migrations/NNNN_описание.sql применяются по порядку номера,
+каждый в своей транзакции; применённые версии хранятся в schema_migrations.
+После миграций создаются партиции таблиц сессий на ближайшие месяцы.
+
+    python -m database.migrate            # применить новые миграции
+    python -m database.migrate --status   # показать состояние
+"""
+import argparse
+import logging
+from pathlib import Path
+from database.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Ключ advisory-блокировки, чтобы два процесса не мигрировали одновременно
+MIGRATION_LOCK_ID = 7_204_311
+PARTITION_MONTHS_AHEAD = 3
+
+
+def list_migrations() -> list[tuple[str, Path]]:
+    files = sorted(MIGRATIONS_DIR.glob("[0-9][0-9][0-9][0-9]_*.sql"))
+    return [(f.name.split("_", 1)[0], f) for f in files]
+
+
+def _ensure_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version    TEXT PRIMARY KEY,
+            name       TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def applied_versions(conn, schema: str | None = None) -> set[str]:
+    with conn.cursor() as cursor:
+        if schema:
+            cursor.execute("SET search_path TO %s", (schema,))
+        _ensure_table(cursor)
+        cursor.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return versions
+
+
+def migrate(conn, schema: str | None = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    """
+    Применяет непримененные миграции на переданном соединении.
+    schema — схема для search_path (используется бенчмарком). Возвращает применённые версии.
+    """
+    applied = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        done = applied_versions(conn, schema)
+        for version, path in list_migrations():
+            if version in done:
+                continue
+            logger.info(f"[MIGRATE] Применяю {path.name}")
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(path.read_text(encoding="utf-8"))
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, path.name)
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"[MIGRATE] Миграция {path.name} не применена")
+                raise
+            applied.append(version)
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT ensure_session_partitions(%s)", (months_ahead,))
+        conn.commit()
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument("--status", action="store_true", help="показать применённые и ожидающие миграции")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD,
+                        help="на сколько месяцев вперёд создавать партиции")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    with get_connection() as conn:
+        if args.status:
+            done = applied_versions(conn)
+            for version, path in list_migrations():
+                print(f"{'[x]' if version in done else '[ ]'} {path.name}")
+            return
+        applied = migrate(conn, months_ahead=args.months_ahead)
+        print(f"Применено миграций: {len(applied)}" + (f" ({', '.join(applied)})" if applied else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+-- Базовая схема бота. Таблицы создаются, только если их ещё нет,
+-- поэтому миграция безопасна для баз, созданных до появления миграций.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id       BIGINT PRIMARY KEY,
+    username      TEXT,
+    first_name    TEXT,
+    last_name     TEXT,
+    first_seen    TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_activity TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    is_admin      BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id SERIAL PRIMARY KEY,
+    user_id    BIGINT NOT NULL REFERENCES users (user_id),
+    start_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_time   TIMESTAMP,
+    completed  BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    feedback_id   SERIAL PRIMARY KEY,
+    user_id       BIGINT NOT NULL REFERENCES users (user_id),
+    feedback_text TEXT NOT NULL,
+    created_at    TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Месячные партиции для таблиц, привязанных к сессии (см. 0002)
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, from_month DATE, months INT) RETURNS void AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+BEGIN
+    FOR i IN 0..months LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_' || to_char(month_start, 'YYYY_MM'),
+            parent,
+            month_start,
+            (month_start + INTERVAL '1 month')::date
+        );
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ensure_session_partitions(months_ahead INT DEFAULT 3) RETURNS void AS $$
+DECLARE
+    parent TEXT;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY[
+        'route_selections', 'location_data', 'photo_location_selections',
+        'cuisine_selections', 'route_parameters'
+    ] LOOP
+        PERFORM create_monthly_partitions(parent, CURRENT_DATE, months_ahead);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,134 @@
+-- Таблицы, привязанные к сессии, партиционируются по месяцам (created_at).
+-- Старые непартиционированные таблицы переименовываются в *_legacy,
+-- их строки переносятся в новые таблицы (created_at берётся из sessions.start_time).
+
+CREATE OR REPLACE FUNCTION detach_legacy_table(tbl TEXT) RETURNS BOOLEAN AS $$
+DECLARE
+    legacy TEXT := tbl || '_legacy';
+    rel    RECORD;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = tbl AND n.nspname = current_schema() AND c.relkind = 'r'
+    ) THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, legacy);
+    -- имена индексов и последовательностей освобождаются для новой таблицы
+    FOR rel IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = format('%I', legacy)::regclass
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', rel.relname, rel.relname || '_legacy');
+    END LOOP;
+    FOR rel IN
+        SELECT s.relname FROM pg_depend d JOIN pg_class s ON s.oid = d.objid
+        WHERE d.refobjid = format('%I', legacy)::regclass AND s.relkind = 'S' AND d.deptype = 'a'
+    LOOP
+        EXECUTE format('ALTER SEQUENCE %I RENAME TO %I', rel.relname, rel.relname || '_legacy');
+    END LOOP;
+
+    EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS created_at TIMESTAMP', legacy);
+    EXECUTE format(
+        'UPDATE %I l SET created_at = COALESCE(l.created_at, s.start_time, CURRENT_TIMESTAMP)
+         FROM sessions s WHERE s.session_id = l.session_id', legacy
+    );
+    EXECUTE format('UPDATE %I SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL', legacy);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION copy_legacy_table(tbl TEXT, columns TEXT) RETURNS void AS $$
+DECLARE
+    legacy     TEXT := tbl || '_legacy';
+    min_month  DATE;
+BEGIN
+    EXECUTE format('SELECT MIN(created_at)::date FROM %I', legacy) INTO min_month;
+    IF min_month IS NOT NULL THEN
+        PERFORM create_monthly_partitions(
+            tbl, min_month,
+            (EXTRACT(YEAR FROM age(CURRENT_DATE, date_trunc('month', min_month))) * 12
+             + EXTRACT(MONTH FROM age(CURRENT_DATE, date_trunc('month', min_month))))::int
+        );
+    END IF;
+    EXECUTE format('INSERT INTO %I (%s, created_at) SELECT %s, created_at FROM %I', tbl, columns, columns, legacy);
+    EXECUTE format('DROP TABLE %I', legacy);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT detach_legacy_table('route_selections');
+SELECT detach_legacy_table('location_data');
+SELECT detach_legacy_table('photo_location_selections');
+SELECT detach_legacy_table('cuisine_selections');
+SELECT detach_legacy_table('route_parameters');
+
+CREATE TABLE IF NOT EXISTS route_selections (
+    id         BIGSERIAL,
+    session_id INTEGER REFERENCES sessions (session_id),
+    route_type TEXT,
+    selected   BOOLEAN,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS location_data (
+    id             BIGSERIAL,
+    session_id     INTEGER REFERENCES sessions (session_id),
+    departure_city TEXT,
+    lat            DOUBLE PRECISION,
+    lon            DOUBLE PRECISION,
+    created_at     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS photo_location_selections (
+    id                  BIGSERIAL,
+    session_id          INTEGER REFERENCES sessions (session_id),
+    photo_location_type TEXT,
+    created_at          TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS cuisine_selections (
+    id           BIGSERIAL,
+    session_id   INTEGER REFERENCES sessions (session_id),
+    cuisine_type TEXT,
+    created_at   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS route_parameters (
+    id         BIGSERIAL,
+    session_id INTEGER REFERENCES sessions (session_id),
+    budget     NUMERIC(12, 2),
+    days       SMALLINT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+SELECT ensure_session_partitions(3);
+
+DO $$
+BEGIN
+    IF to_regclass('route_selections_legacy') IS NOT NULL THEN
+        PERFORM copy_legacy_table('route_selections', 'session_id, route_type, selected');
+    END IF;
+    IF to_regclass('location_data_legacy') IS NOT NULL THEN
+        PERFORM copy_legacy_table('location_data', 'session_id, departure_city, lat, lon');
+    END IF;
+    IF to_regclass('photo_location_selections_legacy') IS NOT NULL THEN
+        PERFORM copy_legacy_table('photo_location_selections', 'session_id, photo_location_type');
+    END IF;
+    IF to_regclass('cuisine_selections_legacy') IS NOT NULL THEN
+        PERFORM copy_legacy_table('cuisine_selections', 'session_id, cuisine_type');
+    END IF;
+    IF to_regclass('route_parameters_legacy') IS NOT NULL THEN
+        PERFORM copy_legacy_table('route_parameters', 'session_id, budget, days');
+    END IF;
+END;
+$$;
+
+DROP FUNCTION detach_legacy_table(TEXT);
+DROP FUNCTION copy_legacy_table(TEXT, TEXT);
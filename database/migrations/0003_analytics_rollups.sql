@@ -0,0 +1,180 @@
+-- Агрегаты для аналитики (get_popular_*, get_user_stats_by_period, get_completion_stats).
+-- Обновляются инкрементально statement-триггерами: один UPSERT на INSERT-запрос,
+-- поэтому пакетная запись из analytics_queue обходится одним обновлением агрегата.
+-- Скрипт идемпотентен; в конце агрегаты пересобираются из исходных таблиц.
+
+CREATE TABLE IF NOT EXISTS analytics_route_counts (
+    route_type TEXT PRIMARY KEY,
+    count      BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_cuisine_counts (
+    cuisine_type TEXT PRIMARY KEY,
+    count        BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_photo_location_counts (
+    photo_location_type TEXT PRIMARY KEY,
+    count               BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_departure_city_counts (
+    departure_city TEXT PRIMARY KEY,
+    count          BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_new_users (
+    day       DATE PRIMARY KEY,
+    new_users BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_session_counts (
+    id        BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total     BIGINT NOT NULL DEFAULT 0,
+    completed BIGINT NOT NULL DEFAULT 0
+);
+
+
+CREATE OR REPLACE FUNCTION analytics_bump_route_counts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_route_counts (route_type, count)
+    SELECT route_type, COUNT(*) FROM new_rows WHERE selected = TRUE GROUP BY route_type
+    ON CONFLICT (route_type) DO UPDATE SET count = analytics_route_counts.count + EXCLUDED.count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_cuisine_counts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_cuisine_counts (cuisine_type, count)
+    SELECT cuisine_type, COUNT(*) FROM new_rows WHERE cuisine_type IS NOT NULL GROUP BY cuisine_type
+    ON CONFLICT (cuisine_type) DO UPDATE SET count = analytics_cuisine_counts.count + EXCLUDED.count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_photo_location_counts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_photo_location_counts (photo_location_type, count)
+    SELECT photo_location_type, COUNT(*) FROM new_rows WHERE photo_location_type IS NOT NULL GROUP BY photo_location_type
+    ON CONFLICT (photo_location_type) DO UPDATE SET count = analytics_photo_location_counts.count + EXCLUDED.count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_departure_city_counts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_departure_city_counts (departure_city, count)
+    SELECT departure_city, COUNT(*) FROM new_rows WHERE departure_city IS NOT NULL GROUP BY departure_city
+    ON CONFLICT (departure_city) DO UPDATE SET count = analytics_departure_city_counts.count + EXCLUDED.count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_daily_new_users() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_daily_new_users (day, new_users)
+    SELECT DATE(first_seen), COUNT(*) FROM new_rows GROUP BY DATE(first_seen)
+    ON CONFLICT (day) DO UPDATE SET new_users = analytics_daily_new_users.new_users + EXCLUDED.new_users;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_sessions_inserted() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_session_counts AS s (id, total, completed)
+    SELECT TRUE, COUNT(*), COUNT(*) FILTER (WHERE completed) FROM new_rows
+    ON CONFLICT (id) DO UPDATE
+    SET total = s.total + EXCLUDED.total,
+        completed = s.completed + EXCLUDED.completed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION analytics_bump_sessions_updated() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO analytics_session_counts AS s (id, completed)
+    SELECT TRUE,
+           COUNT(*) FILTER (WHERE n.completed AND NOT COALESCE(o.completed, FALSE))
+         - COUNT(*) FILTER (WHERE o.completed AND NOT COALESCE(n.completed, FALSE))
+    FROM new_rows n
+    JOIN old_rows o USING (session_id)
+    ON CONFLICT (id) DO UPDATE SET completed = s.completed + EXCLUDED.completed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DROP TRIGGER IF EXISTS analytics_route_counts_trg ON route_selections;
+CREATE TRIGGER analytics_route_counts_trg
+    AFTER INSERT ON route_selections
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_route_counts();
+
+DROP TRIGGER IF EXISTS analytics_cuisine_counts_trg ON cuisine_selections;
+CREATE TRIGGER analytics_cuisine_counts_trg
+    AFTER INSERT ON cuisine_selections
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_cuisine_counts();
+
+DROP TRIGGER IF EXISTS analytics_photo_location_counts_trg ON photo_location_selections;
+CREATE TRIGGER analytics_photo_location_counts_trg
+    AFTER INSERT ON photo_location_selections
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_photo_location_counts();
+
+DROP TRIGGER IF EXISTS analytics_departure_city_counts_trg ON location_data;
+CREATE TRIGGER analytics_departure_city_counts_trg
+    AFTER INSERT ON location_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_departure_city_counts();
+
+DROP TRIGGER IF EXISTS analytics_daily_new_users_trg ON users;
+CREATE TRIGGER analytics_daily_new_users_trg
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_daily_new_users();
+
+DROP TRIGGER IF EXISTS analytics_sessions_inserted_trg ON sessions;
+CREATE TRIGGER analytics_sessions_inserted_trg
+    AFTER INSERT ON sessions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_sessions_inserted();
+
+DROP TRIGGER IF EXISTS analytics_sessions_updated_trg ON sessions;
+CREATE TRIGGER analytics_sessions_updated_trg
+    AFTER UPDATE ON sessions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_bump_sessions_updated();
+
+
+-- Полная пересборка агрегатов (первичное заполнение или после ручной чистки исходных таблиц)
+CREATE OR REPLACE FUNCTION analytics_rebuild_rollups() RETURNS void AS $$
+BEGIN
+    LOCK TABLE route_selections, cuisine_selections, photo_location_selections,
+               location_data, users, sessions IN SHARE MODE;
+
+    TRUNCATE analytics_route_counts, analytics_cuisine_counts, analytics_photo_location_counts,
+             analytics_departure_city_counts, analytics_daily_new_users, analytics_session_counts;
+
+    INSERT INTO analytics_route_counts (route_type, count)
+    SELECT route_type, COUNT(*) FROM route_selections WHERE selected = TRUE GROUP BY route_type;
+
+    INSERT INTO analytics_cuisine_counts (cuisine_type, count)
+    SELECT cuisine_type, COUNT(*) FROM cuisine_selections WHERE cuisine_type IS NOT NULL GROUP BY cuisine_type;
+
+    INSERT INTO analytics_photo_location_counts (photo_location_type, count)
+    SELECT photo_location_type, COUNT(*) FROM photo_location_selections WHERE photo_location_type IS NOT NULL GROUP BY photo_location_type;
+
+    INSERT INTO analytics_departure_city_counts (departure_city, count)
+    SELECT departure_city, COUNT(*) FROM location_data WHERE departure_city IS NOT NULL GROUP BY departure_city;
+
+    INSERT INTO analytics_daily_new_users (day, new_users)
+    SELECT DATE(first_seen), COUNT(*) FROM users GROUP BY DATE(first_seen);
+
+    INSERT INTO analytics_session_counts (id, total, completed)
+    SELECT TRUE, COUNT(*), COUNT(*) FILTER (WHERE completed) FROM sessions;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT analytics_rebuild_rollups();
@@ -0,0 +1,43 @@
+-- Индексы под запросы из database/db.py.
+
+-- Keyset-пагинация пользователей в админке: ORDER BY first_seen DESC, user_id DESC
+-- и условие (first_seen, user_id) < (...). Покрывает и запросы по одному first_seen.
+CREATE INDEX IF NOT EXISTS users_first_seen_user_id_idx
+    ON users (first_seen DESC, user_id DESC);
+
+-- Поиск по началу username: lower(username) LIKE 'prefix%'
+CREATE INDEX IF NOT EXISTS users_username_prefix_idx
+    ON users (lower(username) text_pattern_ops);
+
+-- preload_admins: частичный индекс по немногочисленным администраторам
+CREATE INDEX IF NOT EXISTS users_admins_idx
+    ON users (user_id) WHERE is_admin;
+
+-- Статистика завершения сессий и пересборка агрегатов
+CREATE INDEX IF NOT EXISTS sessions_completed_idx
+    ON sessions (completed);
+
+CREATE INDEX IF NOT EXISTS sessions_user_id_idx
+    ON sessions (user_id);
+
+-- Индексы на партиционированных таблицах создаются во всех партициях
+CREATE INDEX IF NOT EXISTS route_selections_selected_route_type_idx
+    ON route_selections (selected, route_type);
+
+CREATE INDEX IF NOT EXISTS location_data_departure_city_idx
+    ON location_data (departure_city);
+
+CREATE INDEX IF NOT EXISTS route_selections_session_id_idx
+    ON route_selections (session_id);
+
+CREATE INDEX IF NOT EXISTS location_data_session_id_idx
+    ON location_data (session_id);
+
+CREATE INDEX IF NOT EXISTS photo_location_selections_session_id_idx
+    ON photo_location_selections (session_id);
+
+CREATE INDEX IF NOT EXISTS cuisine_selections_session_id_idx
+    ON cuisine_selections (session_id);
+
+CREATE INDEX IF NOT EXISTS route_parameters_session_id_idx
+    ON route_parameters (session_id);
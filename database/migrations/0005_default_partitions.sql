@@ -0,0 +1,51 @@
+-- DEFAULT-партиции для таблиц сессий: если месячная партиция не создана
+-- вовремя, строки попадают в *_default, а не отклоняются.
+-- create_monthly_partitions переносит такие строки в новую месячную партицию,
+-- иначе её нельзя было бы создать при непустой DEFAULT-партиции.
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, from_month DATE, months INT) RETURNS void AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    month_end   DATE;
+    part_name   TEXT;
+    fallback    TEXT := parent || '_default';
+BEGIN
+    FOR i IN 0..months LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        part_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(part_name) IS NULL THEN
+            IF to_regclass(fallback) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    part_name, parent, month_start, month_end
+                );
+            ELSE
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', part_name, parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *)
+                     INSERT INTO %I SELECT * FROM moved',
+                    fallback, month_start, month_end, part_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    parent, part_name, month_start, month_end
+                );
+            END IF;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    parent TEXT;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY[
+        'route_selections', 'location_data', 'photo_location_selections',
+        'cuisine_selections', 'route_parameters'
+    ] LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', parent || '_default', parent);
+    END LOOP;
+END;
+$$;
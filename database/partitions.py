@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from database.db import aensure_session_partitions
+from helpers.metrics import incr
+from config import PARTITION_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionMaintainer:
+    """
+    Раз в interval секунд создаёт месячные партиции таблиц сессий на
+    ближайшие месяцы, чтобы долго работающий бот не писал всё
+    в DEFAULT-партицию. Первая проверка — сразу при запуске; если БД
+    недоступна, повтор через retry_interval секунд.
+    """
+
+    def __init__(self, interval: float = PARTITION_CHECK_INTERVAL, retry_interval: float = 60):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._task: asyncio.Task | None = None
+
+    async def check(self) -> bool:
+        try:
+            await aensure_session_partitions()
+        except Exception as e:
+            logger.warning(f"[DB] Не удалось создать партиции: {e}")
+            return False
+        incr("partitions_checked")
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="partition-maintenance")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            ok = await self.check()
+            await asyncio.sleep(self.interval if ok else self.retry_interval)
+
+
+partition_maintainer = PartitionMaintainer()
@@ -1,16 +1,31 @@
+import html
+import asyncio
+import logging
 from collections import deque
 from aiogram import types
+from aiogram.filters import CommandObject
 from aiogram.enums.parse_mode import ParseMode
 from aiogram.fsm.context import FSMContext
-from database.db import is_user_admin, get_all_users, set_user_admin
+from database.db import ais_user_admin, aget_users_page, aset_user_admin
+from database.export import export_to_file, export_sources, EXPORT_FORMATS
+from LLM.route_cache import route_cache
+from loader import router
 from states.travel_states import TravelForm
-from keyboards.inline_keyboards import get_admin_menu_keyboard, get_back_to_main_keyboard
+from keyboards.inline_keyboards import (
+    get_admin_menu_keyboard, get_back_to_main_keyboard, get_users_page_keyboard
+)
+
+USERS_PAGE_SIZE = 20
+# Ограничение Telegram на размер документа, отправляемого ботом
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
 
 async def show_admin_menu(callback_query: types.CallbackQuery):
     """
     Показывает меню админа (вторая страница клавиатуры).
     """
-    if not is_user_admin(callback_query.from_user.id):
+    if not await ais_user_admin(callback_query.from_user.id):
         await callback_query.answer("Недостаточно прав.", show_alert=True)
         return
 
@@ -20,7 +35,7 @@ async def show_admin_menu(callback_query: types.CallbackQuery):
     await callback_query.answer()
 
 async def view_logs(callback_query: types.CallbackQuery):
-    if not is_user_admin(callback_query.from_user.id):
+    if not await ais_user_admin(callback_query.from_user.id):
         await callback_query.answer("Недостаточно прав.", show_alert=True)
         return
 
@@ -38,14 +53,14 @@ async def view_logs(callback_query: types.CallbackQuery):
 
     text = "".join(last_lines).strip() or "Логи пусты."
     await callback_query.message.answer(
-        f"<pre>{text}</pre>",
+        f"<pre>{html.escape(text)}</pre>",
         parse_mode=ParseMode.HTML,
         reply_markup=get_back_to_main_keyboard()
     )
     await callback_query.answer()
 
 async def clear_logs(callback_query: types.CallbackQuery):
-    if not is_user_admin(callback_query.from_user.id):
+    if not await ais_user_admin(callback_query.from_user.id):
         await callback_query.answer("Недостаточно прав.", show_alert=True)
         return
 
@@ -63,13 +78,58 @@ async def clear_logs(callback_query: types.CallbackQuery):
     finally:
         await callback_query.answer()
 
-async def view_users(callback_query: types.CallbackQuery):
-    if not is_user_admin(callback_query.from_user.id):
+def format_users_page(users, prefix: str | None) -> str:
+    # Сообщение уходит с parse_mode=HTML: введённый префикс и имена экранируются
+    lines = [f"Пользователи с username на «{html.escape(prefix)}»:" if prefix else "Пользователи:"]
+    for u in users:
+        uid = u["user_id"]
+        username = f"@{u['username']}" if u['username'] else "—"
+        name = f"{u['first_name'] or ''} {u['last_name'] or ''}".strip() or "—"
+        admin_flag = "✅" if u['is_admin'] else "❌"
+        lines.append(f"ID: <b>{uid}</b>, {html.escape(username)}, {html.escape(name)}, Admin: {admin_flag}")
+    return "\n".join(lines)
+
+async def load_users_page(state: FSMContext, prefix: str | None = None, direction: str | None = None):
+    """
+    Загружает страницу пользователей и запоминает её границы в FSM.
+    direction: None — первая страница, "next"/"prev" — листание от текущей.
+    Возвращает (текст, клавиатура) или None, если строк нет.
+    """
+    page = (await state.get_data()).get("users_page") or {}
+    after = before = None
+    if direction == "next":
+        after, prefix = page.get("last"), page.get("prefix")
+    elif direction == "prev":
+        before, prefix = page.get("first"), page.get("prefix")
+
+    users, has_more = await aget_users_page(
+        after=after, before=before, limit=USERS_PAGE_SIZE, username_prefix=prefix
+    )
+    if not users:
+        return None
+
+    if direction == "next":
+        has_prev, has_next = True, has_more
+    elif direction == "prev":
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = False, has_more
+
+    # Ключи хранятся строками: FSM-хранилище может сериализовать данные в JSON
+    await state.update_data(users_page={
+        "first": (users[0]["first_seen"].isoformat(), users[0]["user_id"]),
+        "last": (users[-1]["first_seen"].isoformat(), users[-1]["user_id"]),
+        "prefix": prefix,
+    })
+    return format_users_page(users, prefix), get_users_page_keyboard(has_prev, has_next)
+
+async def view_users(callback_query: types.CallbackQuery, state: FSMContext):
+    if not await ais_user_admin(callback_query.from_user.id):
         await callback_query.answer("Недостаточно прав.", show_alert=True)
         return
 
-    users = get_all_users(limit=100)
-    if not users:
+    page = await load_users_page(state)
+    if not page:
         await callback_query.message.answer(
             "Пользователи не найдены.",
             reply_markup=get_back_to_main_keyboard()
@@ -77,32 +137,64 @@ async def view_users(callback_query: types.CallbackQuery):
         await callback_query.answer()
         return
 
-    lines = []
-    for u in users:
-        uid = u["user_id"]
-        username = f"@{u['username']}" if u['username'] else "—"
-        name = f"{u['first_name'] or ''} {u['last_name'] or ''}".strip() or "—"
-        admin_flag = "✅" if u['is_admin'] else "❌"
-        lines.append(f"ID: <b>{uid}</b>, {username}, {name}, Admin: {admin_flag}")
-
-    text = "\n".join(lines)
-    chunks = [text[i:i+3800] for i in range(0, len(text), 3800)]
-    for idx, chunk in enumerate(chunks):
-        if idx == len(chunks) - 1:
-            await callback_query.message.answer(
-                chunk,
-                parse_mode=ParseMode.HTML,
-                reply_markup=get_back_to_main_keyboard()
-            )
-        else:
-            await callback_query.message.answer(
-                chunk,
-                parse_mode=ParseMode.HTML
-            )
+    text, keyboard = page
+    await callback_query.message.answer(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    await callback_query.answer()
+
+async def users_page_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    """
+    Листание списка пользователей: callback_data = users_page:next|prev
+    """
+    if not await ais_user_admin(callback_query.from_user.id):
+        await callback_query.answer("Недостаточно прав.", show_alert=True)
+        return
+
+    if not (await state.get_data()).get("users_page"):
+        await callback_query.answer("Список устарел, откройте его заново.", show_alert=True)
+        return
+
+    _, direction = callback_query.data.split(":", 1)
+    page = await load_users_page(state, direction=direction)
+    if not page:
+        await callback_query.answer("Больше пользователей нет.")
+        return
+
+    text, keyboard = page
+    await callback_query.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    await callback_query.answer()
+
+async def search_users(callback_query: types.CallbackQuery, state: FSMContext):
+    if not await ais_user_admin(callback_query.from_user.id):
+        await callback_query.answer("Недостаточно прав.", show_alert=True)
+        return
+
+    await callback_query.message.answer(
+        "Введите начало username для поиска.",
+        reply_markup=get_back_to_main_keyboard()
+    )
+    await state.set_state(TravelForm.waiting_for_user_search)
     await callback_query.answer()
 
+async def process_user_search(message: types.Message, state: FSMContext):
+    await state.set_state(None)
+    if not await ais_user_admin(message.from_user.id):
+        await message.answer("Недостаточно прав.")
+        return
+
+    prefix = (message.text or "").strip().lstrip("@")
+    page = await load_users_page(state, prefix=prefix or None)
+    if not page:
+        await message.answer(
+            f"Пользователи с username на «{prefix}» не найдены.",
+            reply_markup=get_back_to_main_keyboard()
+        )
+        return
+
+    text, keyboard = page
+    await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
 async def make_admin(callback_query: types.CallbackQuery, state: FSMContext):
-    if not is_user_admin(callback_query.from_user.id):
+    if not await ais_user_admin(callback_query.from_user.id):
         await callback_query.answer("Недостаточно прав.", show_alert=True)
         return
 
@@ -114,14 +206,14 @@ async def make_admin(callback_query: types.CallbackQuery, state: FSMContext):
     await callback_query.answer()
 
 async def process_set_admin(message: types.Message, state: FSMContext):
-    if not is_user_admin(message.from_user.id):
+    if not await ais_user_admin(message.from_user.id):
         await message.answer("Недостаточно прав.")
         await state.finish()
         return
 
     try:
         target_user_id = int(message.text)
-        set_user_admin(target_user_id, True)
+        await aset_user_admin(target_user_id, True)
         await message.answer(
             f"Пользователь с ID <b>{target_user_id}</b> успешно назначен администратором.",
             parse_mode=ParseMode.HTML,
@@ -133,4 +225,98 @@ async def process_set_admin(message: types.Message, state: FSMContext):
             reply_markup=get_back_to_main_keyboard()
         )
     finally:
-        await state.finish()
\ No newline at end of file
+        await state.finish()
+
+def export_usage() -> str:
+    return (
+        "Использование: <code>/export &lt;источник&gt; [csv|jsonl]</code>\n\n"
+        "Источники:\n" + "\n".join(f"• <code>{name}</code>" for name in export_sources())
+    )
+
+async def export_help(callback_query: types.CallbackQuery):
+    if not await ais_user_admin(callback_query.from_user.id):
+        await callback_query.answer("Недостаточно прав.", show_alert=True)
+        return
+
+    await callback_query.message.answer(
+        export_usage(),
+        parse_mode=ParseMode.HTML,
+        reply_markup=get_back_to_main_keyboard()
+    )
+    await callback_query.answer()
+
+async def export_data(message: types.Message, command: CommandObject):
+    """
+    /export <источник> [csv|jsonl] — потоковая выгрузка аналитики в файл.
+    """
+    if not await ais_user_admin(message.from_user.id):
+        await message.answer("Недостаточно прав.")
+        return
+
+    args = (command.args or "").split()
+    if not args or args[0] not in export_sources() or (len(args) > 1 and args[1] not in EXPORT_FORMATS):
+        await message.answer(export_usage(), parse_mode=ParseMode.HTML)
+        return
+
+    source = args[0]
+    fmt = args[1] if len(args) > 1 else "csv"
+    status = await message.answer(f"⏳ Выгружаю {source} в {fmt}...")
+    try:
+        path, count = await asyncio.to_thread(export_to_file, source, fmt)
+    except Exception as e:
+        logger.exception(f"Ошибка выгрузки {source}: {e}")
+        await status.edit_text(f"Ошибка при выгрузке: {e}")
+        return
+
+    size = path.stat().st_size
+    if size > MAX_DOCUMENT_SIZE:
+        await status.edit_text(
+            f"Выгружено строк: {count}. Файл слишком большой для Telegram "
+            f"({size // (1024 * 1024)} МБ), он сохранён на сервере: {path}"
+        )
+        return
+
+    await message.answer_document(
+        types.FSInputFile(path),
+        caption=f"{source}: {count} строк",
+        reply_markup=get_back_to_main_keyboard()
+    )
+    await status.delete()
+    path.unlink(missing_ok=True)
+
+async def purge_route_cache(message: types.Message, command: CommandObject):
+    """
+    /purge_route_cache [expired] — очистка кэша готовых маршрутов
+    (целиком или только просроченных записей).
+    """
+    if not await ais_user_admin(message.from_user.id):
+        await message.answer("Недостаточно прав.")
+        return
+
+    expired_only = (command.args or "").strip() == "expired"
+    removed = await asyncio.to_thread(route_cache.purge, expired_only)
+    left = await asyncio.to_thread(len, route_cache)
+    await message.answer(
+        f"🗑️ Удалено маршрутов из кэша: {removed}. Осталось: {left}.",
+        reply_markup=get_back_to_main_keyboard()
+    )
+
+async def llm_latency(message: types.Message):
+    """
+    /llm_latency — текущие p50/p95 задержек LLM по целям маршрутизатора;
+    по ним выбирается момент дублирующего запроса.
+    """
+    if not await ais_user_admin(message.from_user.id):
+        await message.answer("Недостаточно прав.")
+        return
+
+    stats = router.latency_stats()
+    if not stats:
+        await message.answer("Замеров задержек LLM пока нет.", reply_markup=get_back_to_main_keyboard())
+        return
+    lines = ["⏱️ Задержки LLM, с:"]
+    for name, stat in sorted(stats.items()):
+        lines.append(
+            f"<code>{html.escape(name)}</code>: p50 {stat['p50']:.2f}, p95 {stat['p95']:.2f} ({stat['samples']} замеров)"
+        )
+    await message.answer("\n".join(lines), parse_mode=ParseMode.HTML, reply_markup=get_back_to_main_keyboard())
@@ -1,11 +1,13 @@
 import re
+import asyncio
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from states.travel_states import TravelForm
 from loader import rag_service
-from API.overpass_api import OverpassAPI
-from database.db import save_location
+from API.overpass_api import OverpassAPI, OverpassError
+from API.poi_tile_cache import poi_tiles
+from database.analytics_queue import analytics
 from keyboards.inline_keyboards import get_back_to_main_keyboard
 
 
@@ -39,7 +41,7 @@ async def process_currency_location(message: types.Message, state: FSMContext):
             coords = (float(parts[0]), float(parts[1]))
             loc = text
         else:
-            coords = rag_service.get_coordinates(text)
+            coords = await asyncio.to_thread(rag_service.get_coordinates, text)
             loc = text if coords else None
 
     if not coords:
@@ -49,21 +51,26 @@ async def process_currency_location(message: types.Message, state: FSMContext):
     data = await state.get_data()
     session_id = data.get("session_id")
     if session_id:
-        save_location(session_id, loc, coords[0], coords[1])
+        analytics.enqueue("location_data", session_id, loc, coords[0], coords[1])
 
-    overpass = OverpassAPI()
-    elems = overpass.search_poi_in_radius(coords[0], coords[1], 3000, "amenity", "bank", limit=10)
-    banks = [b for b in elems if b.get("tags", {}).get("name")]
+    overpass = OverpassAPI(tiles=poi_tiles)
+    try:
+        banks = await asyncio.to_thread(
+            overpass.search_poi_in_radius, coords[0], coords[1], 3000, "amenity", "bank", limit=10
+        )
+    except OverpassError:
+        await message.answer("🚨 Не удалось получить список банков. Попробуйте позже.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
 
     if not banks:
         await message.answer("❌ Банки не найдены поблизости.", reply_markup=ReplyKeyboardRemove())
     else:
         text = "🏦 Найденные банки:\n\n"
         for i, b in enumerate(banks[:10], 1):
-            tags = b.get("tags", {})
-            name = tags.get("name", "Без названия")
-            lat = b.get("lat") or b.get("center", {}).get("lat")
-            lon = b.get("lon") or b.get("center", {}).get("lon")
+            tags = b.tags
+            name = b.name
+            lat, lon = b.coords
             addr = f"{tags.get('addr:street','')} {tags.get('addr:housenumber','')}".strip()
             hours = tags.get("opening_hours", "")
             route = f"https://yandex.ru/maps/?rtext={coords[0]},{coords[1]}~{lat},{lon}&rtt=pd"
@@ -1,7 +1,7 @@
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from states.travel_states import TravelForm
-from database.db import save_feedback
+from database.db import asave_feedback
 from handlers.start import back_to_main_callback
 from keyboards.inline_keyboards import get_back_to_main_keyboard
 
@@ -23,7 +23,7 @@ async def process_feedback(message: types.Message, state: FSMContext):
     Обрабатывает текст отзыва, сохраняет его и возвращает пользователя в главное меню.
     """
     try:
-        save_feedback(message.from_user.id, message.text.strip())
+        await asave_feedback(message.from_user.id, message.text.strip())
         await message.answer("✅ Спасибо за ваш отзыв!")
     except Exception:
         await message.answer("❌ Произошла ошибка при сохранении отзыва. Попробуйте позже.")
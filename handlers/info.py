@@ -1,5 +1,5 @@
 from aiogram import types
-from database.db import is_user_admin
+from database.db import ais_user_admin
 from keyboards.inline_keyboards import get_back_to_main_keyboard
 
 async def bot_info(callback: types.CallbackQuery):
@@ -0,0 +1,36 @@
+"""
+Переключение дней постраничного маршрута: день строится при первом
+открытии (если не был подготовлен заранее), следующий — в фоне.
+"""
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from helpers.message_streamer import MessageStreamer
+from keyboards.inline_keyboards import get_day_pager_keyboard
+from LLM.itinerary import itineraries
+from config import ROUTE_STREAMING, STREAM_EDIT_INTERVAL
+
+
+async def day_page_callback(callback: types.CallbackQuery):
+    _, itinerary_id, day = callback.data.split(":")
+    day = int(day)
+    itinerary = itineraries.get(itinerary_id)
+    if itinerary is None or itinerary.user_id != callback.from_user.id:
+        await callback.answer("Маршрут устарел, постройте новый.", show_alert=True)
+        return
+    if not 1 <= day <= itinerary.days:
+        await callback.answer()
+        return
+    await callback.answer()
+
+    streamer = MessageStreamer(callback.message, min_interval=STREAM_EDIT_INTERVAL)
+    try:
+        await callback.message.edit_text(f"⏳ Готовлю день {day}…")
+    except TelegramBadRequest:
+        pass
+    text = await itinerary.day(day, on_draft=streamer.update if ROUTE_STREAMING else None)
+    await streamer.finish(
+        text,
+        parse_mode="HTML",
+        reply_markup=get_day_pager_keyboard(itinerary.id, day, itinerary.days)
+    )
+    itinerary.prefetch(day + 1)
@@ -1,4 +1,5 @@
 import re
+import asyncio
 from helpers.validators import is_valid_coordinate
 from aiogram import types
 from aiogram.exceptions import TelegramBadRequest
@@ -12,11 +13,17 @@ from keyboards.inline_keyboards import (
     get_cuisine_keyboard,
     get_first_time_keyboard
 )
-from database.db import (
-    start_session, save_location, save_photo_location,
-    save_cuisine, save_route_parameters, complete_session
+from database.db import astart_session, acomplete_session
+from database.analytics_queue import analytics
+from LLM.route_queue import route_queue, RouteJob, RouteQueueFull, RouteJobInProgress
+from LLM.memo import RouteMemo, route_memos
+from LLM.prefetch import trip_prefetcher
+
+# Ответы анкеты, которые нужны для перестроения маршрута
+MEMO_KEYS = (
+    "session_id", "selected_routes", "location", "budget", "days",
+    "is_first_time", "photo_locations", "cuisine_options"
 )
-from LLM.llm import generate_route
 
 async def start_parameter_collection(
     callback: types.CallbackQuery,
@@ -26,7 +33,7 @@ async def start_parameter_collection(
     data = await state.get_data()
     session_id = data.get("session_id")
     if not session_id:
-        session_id = start_session(callback.from_user.id)
+        session_id = await astart_session(callback.from_user.id)
         await state.update_data(session_id=session_id)
 
     questions = ["location", "budget", "days", "first_time"]
@@ -116,6 +123,7 @@ async def process_location(message: types.Message, state: FSMContext):
     """
     Принимаем локацию или текст. Здесь НЕ отправляем отдельное сообщение,
     remove-клавиатуру уберёт следующая функция ask_next_question.
+    Как только известны координаты, в фоне начинается загрузка города и мест.
     """
     data = await state.get_data()
     session_id = data.get("session_id")
@@ -124,35 +132,49 @@ async def process_location(message: types.Message, state: FSMContext):
         lat, lon = message.location.latitude, message.location.longitude
         loc = f"{lat}, {lon}"
         await state.update_data(location=loc)
-        save_location(session_id, "Координаты", lat, lon)
+        analytics.enqueue("location_data", session_id, "Координаты", lat, lon)
+        trip_prefetcher.start(message.chat.id, loc, (lat, lon))
     else:
         text = message.text.strip()
         if is_valid_coordinate(text):
             lat, lon = re.split(r'[,\s]+', text)
             loc = (float(lat), float(lon))
             await state.update_data(location=loc)
-            save_location(session_id, text, lat, lon)
+            analytics.enqueue("location_data", session_id, text, lat, lon)
+            trip_prefetcher.start(message.chat.id, str(loc), loc)
         else:
-            cords = rag_service.get_coordinates(text)
+            cords = await asyncio.to_thread(rag_service.get_coordinates, text)
             if not cords:
                 await message.answer(
                     "🚨 Не удалось найти место. Попробуйте точнее или отправьте геолокацию."
                 )
                 return
             await state.update_data(location=text, coords=cords)
-            save_location(session_id, text, cords[0], cords[1])
+            analytics.enqueue("location_data", session_id, text, cords[0], cords[1])
+            trip_prefetcher.start(message.chat.id, text, cords)
 
     await state.update_data(question_index=data.get("question_index", 0) + 1)
     await ask_next_question(message, state)
 
-async def process_budget(message: types.Message, state: FSMContext):
+def parse_budget(text: str | None) -> float | None:
     try:
-        b = float(message.text)
+        b = float(text)
         if b < 0:
             raise ValueError
-        if b > 1e6:
-            b = 1e6
-    except ValueError:
+    except (TypeError, ValueError):
+        return None
+    return min(b, 1e6)
+
+def parse_days(text: str | None) -> int | None:
+    try:
+        d = int(text)
+    except (TypeError, ValueError):
+        return None
+    return d if 1 <= d <= 7 else None
+
+async def process_budget(message: types.Message, state: FSMContext):
+    b = parse_budget(message.text)
+    if b is None:
         await message.answer("🚨 Введите корректное число для бюджета.")
         return
 
@@ -183,11 +205,28 @@ async def toggle_photo_locations(callback: types.CallbackQuery, state: FSMContex
     await callback.answer("Обновлено!")
 
 
+# Вопросы, от ответов на которые зависит поиск мест
+PREFERENCE_QUESTIONS = ("photo", "food")
+
+
+def refine_prefetch(chat_id: int, data: dict):
+    """
+    Уточняет фоновый поиск мест под предпочтения, но только после последнего
+    вопроса о них: отменённое уточнение не останавливает уже начатый
+    в потоке запрос к Overpass и OSRM.
+    """
+    remaining = data.get("questions_order", [])[data.get("question_index", 0) + 1:]
+    if any(step in PREFERENCE_QUESTIONS for step in remaining):
+        return
+    trip_prefetcher.refine(chat_id, data.get("photo_locations", []) + data.get("cuisine_options", []))
+
+
 async def confirm_photo_locations(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_reply_markup(reply_markup=None)
     data = await state.get_data()
     for loc in data.get("photo_locations", []):
-        save_photo_location(data.get("session_id"), loc)
+        analytics.enqueue("photo_location_selections", data.get("session_id"), loc)
+    refine_prefetch(callback.message.chat.id, data)
     await callback.answer("Фото‑локации сохранены!")
     await state.update_data(question_index=data.get("question_index", 0) + 1)
     await ask_next_question(callback.message, state)
@@ -218,18 +257,16 @@ async def confirm_cuisine(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_reply_markup(reply_markup=None)
     data = await state.get_data()
     for c in data.get("cuisine_options", []):
-        save_cuisine(data.get("session_id"), c)
+        analytics.enqueue("cuisine_selections", data.get("session_id"), c)
+    refine_prefetch(callback.message.chat.id, data)
     await callback.answer("Кухни сохранены!")
     await state.update_data(question_index=data.get("question_index", 0) + 1)
     await ask_next_question(callback.message, state)
 
 
 async def process_days(message: types.Message, state: FSMContext):
-    try:
-        d = int(message.text)
-        if not (1 <= d <= 7):
-            raise ValueError
-    except ValueError:
+    d = parse_days(message.text)
+    if d is None:
         await message.answer("🚨 Введите число от 1 до 7 для дней.")
         return
     await state.update_data(days=d)
@@ -251,8 +288,8 @@ async def process_first_time(callback: types.CallbackQuery, state: FSMContext):
 async def finish_parameters_collection(message: types.Message, state: FSMContext):
     data = await state.get_data()
     session_id = data.get("session_id")
-    save_route_parameters(session_id, data.get("budget"), data.get("days"))
-    complete_session(session_id)
+    analytics.enqueue("route_parameters", session_id, data.get("budget"), data.get("days"))
+    await acomplete_session(session_id)
 
     resp = (
         "✅ Сбор параметров завершён!\n\n"
@@ -268,9 +305,19 @@ async def finish_parameters_collection(message: types.Message, state: FSMContext
 
     await message.answer(resp)
 
-    llm = generate_route(
+    memo = RouteMemo(data={key: data.get(key) for key in MEMO_KEYS})
+    route_memos.set(message.chat.id, memo)
+    await state.clear()
+    await submit_route(message, build_route_params(memo.data), memo, prefetch_key=message.chat.id)
+
+
+def build_route_params(data: dict) -> dict:
+    """
+    Аргументы generate_route из ответов анкеты.
+    """
+    return dict(
         departure=str(data.get("location")),
-        preferences=data.get("photo_locations", []) + data.get("cuisine_options", []),
+        preferences=(data.get("photo_locations") or []) + (data.get("cuisine_options") or []),
         route_type=" и ".join([
             t for t in (
                 "живописными местами" if data["selected_routes"].get("photo") else "",
@@ -281,5 +328,44 @@ async def finish_parameters_collection(message: types.Message, state: FSMContext
         budget=float(data.get("budget")),
         is_first_time=data.get("is_first_time", True)
     )
-    await message.answer(llm, parse_mode="HTML")
-    await state.clear()
+
+
+def cancel_prefetch(key):
+    if key is not None:
+        trip_prefetcher.cancel(key)
+
+
+async def submit_route(
+    message: types.Message,
+    params: dict,
+    memo: RouteMemo | None = None,
+    prefetch_key=None
+):
+    """
+    Ставит построение маршрута в очередь и показывает статус.
+    prefetch_key — ключ фоновой загрузки контекста поездки, начатой во время
+    анкеты: она забирается, если маршрут принят, и отменяется, если нет.
+    """
+    status = await message.answer("⏳ Запрос принят")
+    prefetch = trip_prefetcher.peek(prefetch_key) if prefetch_key is not None else None
+    try:
+        position = await route_queue.submit(RouteJob(
+            user_id=message.chat.id,
+            chat_id=message.chat.id,
+            params=params,
+            status=status,
+            memo=memo,
+            prefetch=prefetch
+        ))
+    except RouteJobInProgress:
+        cancel_prefetch(prefetch_key)
+        await status.edit_text("⏳ Предыдущий маршрут ещё строится, дождитесь его, пожалуйста.")
+        return
+    except RouteQueueFull:
+        cancel_prefetch(prefetch_key)
+        await status.edit_text("😔 Сейчас слишком много запросов. Попробуйте через пару минут.")
+        return
+    if prefetch_key is not None:
+        trip_prefetcher.pop(prefetch_key)
+    if position:
+        await status.edit_text(f"⏳ Запрос в очереди, перед вами: {position}")
@@ -1,6 +1,6 @@
 from aiogram import types
 from aiogram.types import ReplyKeyboardRemove
-from database.db import is_user_admin
+from database.db import ais_user_admin
 from keyboards.inline_keyboards import get_main_menu_keyboard
 
 WELCOME_TEXT = (
@@ -16,7 +16,7 @@ async def welcome(message: types.Message):
     """
     await message.answer(
         WELCOME_TEXT,
-        reply_markup=get_main_menu_keyboard(is_admin=is_user_admin(message.from_user.id))
+        reply_markup=get_main_menu_keyboard(is_admin=await ais_user_admin(message.from_user.id))
     )
 
 async def back_to_main_callback(source):
@@ -26,7 +26,7 @@ async def back_to_main_callback(source):
     - если source — Message, отправляет новое
     """
     if isinstance(source, types.CallbackQuery):
-        admin = is_user_admin(source.from_user.id)
+        admin = await ais_user_admin(source.from_user.id)
         await source.message.edit_text(
             WELCOME_TEXT,
             reply_markup=get_main_menu_keyboard(is_admin=admin)
@@ -0,0 +1,100 @@
+"""
+Перестроение готового маршрута с изменёнными параметрами.
+Координаты, город, найденные места и адреса берутся из контекста
+прошлого построения, заново выполняется только генерация
+(и поиск мест, если поменялись предпочтения).
+"""
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from handlers.parameters import build_route_params, submit_route, parse_budget, parse_days
+from keyboards.inline_keyboards import CUISINE_OPTIONS, get_cuisine_keyboard, get_tweak_keyboard
+from helpers.metrics import incr
+from LLM.memo import RouteMemo, route_memos
+from states.travel_states import TravelForm
+
+
+async def tweak_menu(callback: types.CallbackQuery, state: FSMContext):
+    if route_memos.get(callback.from_user.id) is None:
+        await callback.answer("Маршрут устарел, постройте новый.", show_alert=True)
+        return
+    await callback.answer()
+    await callback.message.answer("🔄 Что изменить в маршруте?", reply_markup=get_tweak_keyboard())
+
+
+async def tweak_option(callback: types.CallbackQuery, state: FSMContext):
+    memo = route_memos.get(callback.from_user.id)
+    if memo is None:
+        await callback.answer("Маршрут устарел, постройте новый.", show_alert=True)
+        return
+    _, option = callback.data.split(":", 1)
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    if option == "budget":
+        await callback.message.answer("💰 Введите новый бюджет в рублях:")
+        await state.set_state(TravelForm.waiting_for_tweak_budget)
+    elif option == "days":
+        await callback.message.answer("📆 Сколько дней должно быть в маршруте? (от 1 до 7)")
+        await state.set_state(TravelForm.waiting_for_tweak_days)
+    elif option == "cuisine":
+        selected = list(memo.data.get("cuisine_options") or [])
+        await state.update_data(cuisine_options=selected)
+        await callback.message.answer(
+            "🍽️ Выберите предпочитаемые кухни:",
+            reply_markup=get_cuisine_keyboard(selected, CUISINE_OPTIONS)
+        )
+        await state.set_state(TravelForm.waiting_for_tweak_cuisine)
+    else:
+        await rebuild_route(callback.message, memo, {}, fresh=True)
+
+
+async def process_tweak_budget(message: types.Message, state: FSMContext):
+    budget = parse_budget(message.text)
+    if budget is None:
+        await message.answer("🚨 Введите корректное число для бюджета.")
+        return
+    await _rebuild_from_state(message, state, {"budget": budget})
+
+
+async def process_tweak_days(message: types.Message, state: FSMContext):
+    days = parse_days(message.text)
+    if days is None:
+        await message.answer("🚨 Введите число от 1 до 7 для дней.")
+        return
+    await _rebuild_from_state(message, state, {"days": days})
+
+
+async def confirm_tweak_cuisine(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.answer("Кухни сохранены!")
+    data = await state.get_data()
+    selected = data.get("cuisine_options", [])
+    memo = route_memos.get(callback.from_user.id)
+    routes = dict((memo.data.get("selected_routes") or {}) if memo else {})
+    routes["food"] = bool(selected)
+    await _rebuild_from_state(
+        callback.message, state, {"cuisine_options": selected, "selected_routes": routes},
+        user_id=callback.from_user.id
+    )
+
+
+async def _rebuild_from_state(message: types.Message, state: FSMContext, changes: dict, user_id: int | None = None):
+    await state.clear()
+    memo = route_memos.get(user_id or message.from_user.id)
+    if memo is None:
+        await message.answer("Маршрут устарел, постройте новый.")
+        return
+    await rebuild_route(message, memo, changes)
+
+
+async def rebuild_route(message: types.Message, memo: RouteMemo, changes: dict, fresh: bool = False):
+    """
+    Ставит в очередь маршрут с изменёнными параметрами, переиспользуя
+    контекст прошлого построения. fresh — новый вариант без изменений, мимо кэша.
+    """
+    incr("route_rebuilds")
+    new_memo = RouteMemo(data={**memo.data, **changes}, trip=memo.trip)
+    route_memos.set(message.chat.id, new_memo)
+    params = build_route_params(new_memo.data)
+    params.update(trip=memo.trip, fresh=fresh)
+    await submit_route(message, params, new_memo)
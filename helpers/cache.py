@@ -1,3 +1,5 @@
+import time
+import threading
 from functools import lru_cache
 
 def cached(maxsize: int = 128):
@@ -7,3 +9,46 @@ def cached(maxsize: int = 128):
     def decorator(func):
         return lru_cache(maxsize=maxsize)(func)
     return decorator
+
+
+class TTLCache:
+    """
+    Простой потокобезопасный кэш «ключ → значение» со временем жизни записей.
+    При переполнении вытесняется самая старая запись.
+    """
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def invalidate(self, key=None):
+        """
+        Удаляет запись по ключу или весь кэш, если ключ не указан.
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,7 +1,7 @@
 import json
 import csv
 from pathlib import Path
-from typing import Any, Sequence
+from typing import Any, Sequence, Iterable
 
 def read_json(path: str) -> Any:
     with open(path, "r", encoding="utf-8") as f:
@@ -24,3 +24,34 @@ def write_csv(path: str, rows: Sequence[dict], fieldnames: list[str]):
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(rows)
+
+
+def write_csv_stream(path: str, batches: Iterable[Sequence[dict]], fieldnames: list[str]) -> int:
+    """
+    Пишет CSV по пачкам, не собирая весь набор строк в памяти.
+    Возвращает количество записанных строк.
+    """
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(p, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for batch in batches:
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+def write_jsonl_stream(path: str, batches: Iterable[Sequence[dict]]) -> int:
+    """
+    Пишет JSON Lines по пачкам: одна строка файла — один объект.
+    Значения, которых нет в JSON (даты, Decimal), сохраняются строками.
+    """
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(p, "w", encoding="utf-8") as f:
+        for batch in batches:
+            f.writelines(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch)
+            count += len(batch)
+    return count
@@ -1,5 +1,5 @@
 from math import radians, sin, cos, sqrt, asin
-from typing import Tuple
+from typing import Iterable, List, Tuple
 
 def haversine(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
     """
@@ -13,8 +13,89 @@ def haversine(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float
     c = 2 * asin(sqrt(a))
     return 6371 * c
 
+def distances_from(origin: Tuple[float, float], points: Iterable[Tuple[float, float]]) -> List[float]:
+    """
+    Расстояния в км от origin до каждой из точек; общие для всех точек
+    величины считаются один раз.
+    """
+    lat0, lon0 = map(radians, origin)
+    cos_lat0 = cos(lat0)
+    result = []
+    for lat, lon in points:
+        lat, lon = radians(lat), radians(lon)
+        a = sin((lat - lat0) / 2) ** 2 + cos_lat0 * cos(lat) * sin((lon - lon0) / 2) ** 2
+        result.append(12742 * asin(sqrt(a)))
+    return result
+
 def format_coord(coord: Tuple[float, float]) -> str:
     """
     Форматирует координаты «lat,lon».
     """
     return f"{coord[0]:.6f},{coord[1]:.6f}"
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """
+    Geohash точки заданной длины.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code = []
+    bits, bit_count, even = 0, 0, True
+    while len(code) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            rng[0] = mid
+        else:
+            bits = bits * 2
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            code.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(code)
+
+def geohash_bbox(code: str) -> Tuple[float, float, float, float]:
+    """
+    Границы тайла geohash: (юг, запад, север, восток).
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in code:
+        bits = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if bits >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+def geohash_cover(lat: float, lon: float, radius_m: float, precision: int) -> List[str]:
+    """
+    Тайлы geohash, пересекающие круг радиусом radius_m вокруг точки.
+    """
+    dlat = radius_m / 111320
+    dlon = radius_m / (111320 * max(cos(radians(lat)), 0.01))
+    south, west = max(lat - dlat, -90.0), lon - dlon
+    north, east = min(lat + dlat, 90.0), lon + dlon
+    s, w, n, e = geohash_bbox(geohash_encode(south, west, precision))
+    height, width = n - s, e - w
+    tiles = []
+    row = s + height / 2
+    while row - height / 2 <= north:
+        col = w + width / 2
+        while col - width / 2 <= east:
+            # Ближайшая к центру точка тайла; угловые тайлы вне круга не нужны
+            near_lat = min(max(lat, row - height / 2), row + height / 2)
+            near_lon = min(max(lon, col - width / 2), col + width / 2)
+            if haversine((lat, lon), (near_lat, near_lon)) * 1000 <= radius_m:
+                tiles.append(geohash_encode(row, col, precision))
+            col += width
+        row += height
+    return tiles
@@ -0,0 +1,108 @@
+import time
+import asyncio
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from helpers.validators import chunk_html
+
+TELEGRAM_TEXT_LIMIT = 4096
+# Сколько раз повторять итоговую отправку после TelegramRetryAfter
+FINISH_RETRIES = 3
+
+
+class MessageStreamer:
+    """
+    Показывает текст, который генерируется по частям, редактируя одно сообщение.
+    Правки идут не чаще min_interval секунд (лимиты Telegram на edit),
+    промежуточные версии между правками просто пропускаются.
+    """
+
+    def __init__(self, message: Message, min_interval: float = 1.0):
+        self.message = message
+        self.min_interval = min_interval
+        self._text = ""
+        self._footer = ""
+        self._shown = ""
+        self._next_edit = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return bool(self._text)
+
+    async def update(self, text: str):
+        self._text = text
+        await self._flush()
+
+    async def set_footer(self, footer: str):
+        """
+        Строка состояния под текстом; выводится сразу, без ожидания интервала.
+        """
+        self._footer = footer
+        await self._flush(force=True)
+
+    def _render(self) -> str:
+        footer = f"\n\n⏳ {self._footer}" if self._footer else "\n\n⏳"
+        body = self._text[:TELEGRAM_TEXT_LIMIT - len(footer) - 1]
+        if len(body) < len(self._text):
+            body += "…"
+        return body + footer
+
+    async def _flush(self, force: bool = False):
+        if self._lock.locked() and not force:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if now < self._next_edit and not force:
+                return
+            if force and now < self._next_edit:
+                await asyncio.sleep(self._next_edit - now)
+            text = self._render()
+            if text == self._shown:
+                return
+            try:
+                await self.message.edit_text(text)
+                self._shown = text
+            except TelegramRetryAfter as e:
+                self._next_edit = time.monotonic() + e.retry_after
+                return
+            except TelegramBadRequest:
+                pass
+            self._next_edit = time.monotonic() + self.min_interval
+
+    @staticmethod
+    async def _retrying(method, *args, **kwargs):
+        """
+        Вызывает метод Telegram, пережидая TelegramRetryAfter.
+        """
+        for attempt in range(FINISH_RETRIES + 1):
+            try:
+                return await method(*args, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == FINISH_RETRIES:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def finish(self, text: str, parse_mode: str | None = "HTML", **kwargs):
+        """
+        Заменяет черновик итоговым текстом. Если он не помещается в одно
+        сообщение, текст отправляется частями по абзацам и строкам (теги
+        не разрезаются), а черновик удаляется после первой части.
+        """
+        async with self._lock:
+            if len(text) <= TELEGRAM_TEXT_LIMIT:
+                try:
+                    await self._retrying(self.message.edit_text, text, parse_mode=parse_mode, **kwargs)
+                    return
+                except TelegramBadRequest:
+                    pass
+            chunks = chunk_html(text, TELEGRAM_TEXT_LIMIT)
+            for i, chunk in enumerate(chunks):
+                await self._retrying(
+                    self.message.answer,
+                    chunk, parse_mode=parse_mode, **(kwargs if i == len(chunks) - 1 else {})
+                )
+                if i == 0:
+                    try:
+                        await self.message.delete()
+                    except TelegramBadRequest:
+                        pass
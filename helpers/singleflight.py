@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+from helpers.metrics import incr
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов в потоках: пока вычисление
+    по ключу выполняется, остальные вызовы с тем же ключом ждут его
+    и получают тот же результат (или то же исключение).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            incr(f"{self.name}_coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    То же для корутин: вычисление выполняется отдельной задачей, поэтому
+    отмена одного из ожидающих не прерывает его для остальных.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибка уже передана ожидающим
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            incr(f"{self.name}_coalesced")
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
@@ -0,0 +1,131 @@
+"""
+Исполнитель графа этапов: каждый этап запускается, как только готовы
+его зависимости, независимые этапы идут параллельно, у каждого свой таймаут.
+Время каждого этапа и всего графа пишется в метрики.
+"""
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+from helpers.metrics import incr, gauge
+
+logger = logging.getLogger(__name__)
+
+_REQUIRED = object()
+
+
+class Stop:
+    """
+    Результат этапа, после которого граф досрочно завершается
+    (например, маршрут найден в кэше). value возвращается вызывающему.
+    """
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class StageTimeout(asyncio.TimeoutError):
+    pass
+
+
+@dataclass
+class Stage:
+    """
+    func получает словарь уже готовых результатов (входы графа и этапы)
+    и возвращает результат этапа. Если задан default, он подставляется
+    при таймауте или ошибке этапа; иначе ошибка прерывает весь граф.
+    """
+    name: str
+    func: Callable[[dict], Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    default: Any = _REQUIRED
+
+
+@dataclass
+class GraphResult:
+    results: dict[str, Any]
+    timings: dict[str, float] = field(default_factory=dict)
+    stopped: Optional[Stop] = None
+    # Этапы, вместо результата которых подставлен default
+    fallbacks: set[str] = field(default_factory=set)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+
+class StageGraph:
+    def __init__(self, name: str, stages: list[Stage]):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+
+    async def _run_stage(self, stage: Stage, result: GraphResult, tasks: dict[str, asyncio.Task]) -> Any:
+        for dep in stage.deps:
+            if dep in tasks:
+                await tasks[dep]
+            elif dep not in result.results:
+                raise KeyError(f"{self.name}: этапу {stage.name} не хватает {dep}")
+        if any(isinstance(result.results.get(dep), Stop) for dep in stage.deps):
+            return None
+        started = time.monotonic()
+        try:
+            value = await asyncio.wait_for(stage.func(result.results), stage.timeout)
+        except asyncio.TimeoutError:
+            incr(f"stage_{stage.name}_timeout")
+            if stage.default is _REQUIRED:
+                raise StageTimeout(f"{self.name}: этап {stage.name} не уложился в {stage.timeout} с")
+            logger.warning(f"[STAGES] {self.name}: этап {stage.name} прерван по таймауту")
+            value = stage.default
+            result.fallbacks.add(stage.name)
+        except Exception as e:
+            incr(f"stage_{stage.name}_error")
+            if stage.default is _REQUIRED:
+                raise
+            logger.warning(f"[STAGES] {self.name}: ошибка этапа {stage.name}: {e}")
+            value = stage.default
+            result.fallbacks.add(stage.name)
+        finally:
+            elapsed = time.monotonic() - started
+            result.timings[stage.name] = elapsed
+            gauge(f"stage_{stage.name}_time", elapsed)
+        result.results[stage.name] = value
+        return value
+
+    async def run(self, **inputs) -> GraphResult:
+        """
+        Выполняет граф. Если какой-то этап вернул Stop, остальные отменяются
+        и результат содержит stopped.
+        """
+        result = GraphResult(results=dict(inputs))
+        started = time.monotonic()
+        tasks: dict[str, asyncio.Task] = {}
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, result, tasks))
+        pending = set(tasks.values())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    value = task.result()
+                    if isinstance(value, Stop):
+                        result.stopped = value
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            gauge(f"{self.name}_pipeline_time", time.monotonic() - started)
+
+
+@contextmanager
+def stage_timer(name: str):
+    """
+    Замер времени этапа, выполняемого вне графа (например, запроса к модели).
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        gauge(f"stage_{name}_time", time.monotonic() - started)
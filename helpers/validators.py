@@ -13,3 +13,73 @@ def clamp(value: float, min_v: float, max_v: float) -> float:
 
 def chunk_text(text: str, size: int = 4000) -> List[str]:
     return [text[i:i+size] for i in range(0, len(text), size)]
+
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|[^<&]+|[<&]")
+
+def _safe_cut(text: str, size: int) -> int:
+    """
+    Позиция разреза не дальше size: вне тегов, сущностей и незакрытых элементов,
+    по возможности — на пробеле.
+    """
+    depth, pos, best, best_space = 0, 0, 0, 0
+    for token in _HTML_TOKEN.finditer(text):
+        value = token.group()
+        if value.startswith("<") and value.endswith(">") and len(value) > 1:
+            if value.startswith("</"):
+                depth = max(depth - 1, 0)
+            elif not value.endswith("/>"):
+                depth += 1
+            parts = [value]
+        elif value.startswith("&") or depth:
+            parts = [value]
+        else:
+            parts = value
+        for part in parts:
+            if pos + len(part) > size:
+                return best_space or best or size
+            pos += len(part)
+            if depth == 0:
+                best = pos
+                if part.isspace():
+                    best_space = pos
+    return pos
+
+def chunk_html(text: str, size: int = 4096) -> List[str]:
+    """
+    Делит HTML-текст на части не длиннее size: по абзацам, затем по строкам;
+    длинная строка режется вне тегов и сущностей.
+    """
+    chunks, current = [], ""
+    for paragraph in text.split("\n\n"):
+        for piece in _split_long(paragraph, size):
+            joined = f"{current}\n\n{piece}" if current else piece
+            if len(joined) <= size:
+                current = joined
+            else:
+                chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _split_long(paragraph: str, size: int) -> List[str]:
+    if len(paragraph) <= size:
+        return [paragraph]
+    pieces, current = [], ""
+    for line in paragraph.split("\n"):
+        while len(line) > size:
+            cut = _safe_cut(line, size)
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:cut].rstrip())
+            line = line[cut:].lstrip()
+        joined = f"{current}\n{line}" if current else line
+        if len(joined) <= size:
+            current = joined
+        else:
+            pieces.append(current)
+            current = line
+    if current:
+        pieces.append(current)
+    return pieces
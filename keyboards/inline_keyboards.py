@@ -168,14 +168,67 @@ def get_cuisine_keyboard(selected: list, options: list) -> InlineKeyboardMarkup:
 
 def get_admin_menu_keyboard() -> InlineKeyboardMarkup:
     """
-    Меню админа: логи, пользователи, назначить админа, очистить логи.
+    Меню админа: логи, пользователи, назначить админа, экспорт, очистить логи.
     """
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="📜 Просмотреть логи", callback_data="view_logs")],
             [InlineKeyboardButton(text="👥 Просмотреть пользователей", callback_data="view_users")],
             [InlineKeyboardButton(text="➕ Назначить админа", callback_data="make_admin")],
+            [InlineKeyboardButton(text="📤 Экспорт аналитики", callback_data="export_help")],
             [InlineKeyboardButton(text="🗑️ Очистить логи", callback_data="clear_logs")],
             [InlineKeyboardButton(text="↩️ Вернуться в главное меню", callback_data="back_to_main")],
         ]
     )
+
+
+def get_users_page_keyboard(has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Навигация по списку пользователей в админке.
+    """
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data="users_page:prev"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data="users_page:next"))
+    buttons = [nav] if nav else []
+    buttons.append([InlineKeyboardButton(text="🔎 Поиск по username", callback_data="search_users")])
+    buttons.append([InlineKeyboardButton(text="↩️ Вернуться в главное меню", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_day_pager_keyboard(itinerary_id: str, day: int, days: int) -> InlineKeyboardMarkup:
+    """
+    Переключение дней постраничного маршрута.
+    """
+    nav = []
+    if day > 1:
+        nav.append(InlineKeyboardButton(text=f"⬅️ День {day - 1}", callback_data=f"day_page:{itinerary_id}:{day - 1}"))
+    if day < days:
+        nav.append(InlineKeyboardButton(text=f"День {day + 1} ➡️", callback_data=f"day_page:{itinerary_id}:{day + 1}"))
+    buttons = [nav] if nav else []
+    buttons.append([InlineKeyboardButton(text="🔄 Изменить маршрут", callback_data="tweak_route")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_route_actions_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🔄 Изменить маршрут", callback_data="tweak_route")],
+        ]
+    )
+
+
+def get_tweak_keyboard() -> InlineKeyboardMarkup:
+    """
+    Что поменять при перестроении маршрута.
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="💰 Другой бюджет", callback_data="tweak:budget")],
+            [InlineKeyboardButton(text="📆 Другое число дней", callback_data="tweak:days")],
+            [InlineKeyboardButton(text="🍽️ Другие кухни", callback_data="tweak:cuisine")],
+            [InlineKeyboardButton(text="🎲 Другой вариант", callback_data="tweak:again")],
+            [InlineKeyboardButton(text="↩️ Вернуться в главное меню", callback_data="back_to_main")],
+        ]
+    )
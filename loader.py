@@ -1,11 +1,23 @@
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import TOKEN, API_KEY
+from config import (
+    TOKEN, API_KEY, LLM_FALLBACKS, LLM_FALLBACK_API_KEY,
+    LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_DEFAULT_DELAY
+)
 from LLM.rag import RAGService
+from LLM.router import ModelRouter, parse_targets
 import openai
 
 storage     = MemoryStorage()
 bot         = Bot(token=TOKEN)
 dp          = Dispatcher(storage=storage)
 rag_service = RAGService()
-client      = openai.OpenAI(api_key=API_KEY, base_url="https://hubai.loe.gg/v1")
+client      = openai.AsyncOpenAI(api_key=API_KEY, base_url="https://hubai.loe.gg/v1")
+router      = ModelRouter(
+    client,
+    parse_targets(LLM_FALLBACKS),
+    api_key=LLM_FALLBACK_API_KEY or API_KEY,
+    hedge_percentile=LLM_HEDGE_PERCENTILE,
+    hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+    hedge_default_delay=LLM_HEDGE_DEFAULT_DELAY
+)
@@ -1,7 +1,93 @@
+import time
+import asyncio
+import logging
 from aiogram import BaseMiddleware
 from typing import Any, Dict, Callable, Awaitable
-from aiogram.types import Message, CallbackQuery
-from database.db import register_user, start_session
+from aiogram.types import Message, CallbackQuery, User
+from database.db import aregister_user, astart_session, atouch_users
+from helpers.metrics import incr
+from config import USER_ACTIVITY_INTERVAL, USER_ACTIVITY_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class UserActivityTracker:
+    """
+    Помнит, что последним записано в users для каждого пользователя.
+    Полный UPSERT выполняется только для нового пользователя, при смене
+    username/имени или если с прошлой записи прошло больше interval секунд.
+    Остальные обновления last_activity копятся и сбрасываются пачкой.
+    """
+
+    def __init__(
+        self,
+        interval: float = USER_ACTIVITY_INTERVAL,
+        flush_interval: float = USER_ACTIVITY_FLUSH_INTERVAL
+    ):
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._written: dict[int, tuple[tuple, float]] = {}
+        self._pending: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    async def register(self, user: User) -> int:
+        profile = (user.username, user.first_name, user.last_name)
+        now = time.monotonic()
+        written = self._written.get(user.id)
+        if written and written[0] == profile and now - written[1] < self.interval:
+            self._pending[user.id] = now
+            incr("user_upserts_coalesced")
+            return user.id
+
+        user_id = await aregister_user(
+            user_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name
+        )
+        self._written[user.id] = (profile, now)
+        self._pending.pop(user.id, None)
+        incr("user_upserts")
+        return user_id
+
+    async def flush(self):
+        now = time.monotonic()
+        pending, self._pending = self._pending, {}
+        if pending:
+            try:
+                await atouch_users({uid: now - seen for uid, seen in pending.items()})
+                incr("user_activity_flushed", len(pending))
+            except Exception as e:
+                logger.warning(f"[DB] Не удалось обновить last_activity для {len(pending)} пользователей: {e}")
+                for uid, seen in pending.items():
+                    self._pending.setdefault(uid, seen)
+        # устаревшие записи всё равно приведут к полному UPSERT, держать их незачем
+        for uid in [uid for uid, (_, ts) in self._written.items() if now - ts >= self.interval]:
+            if uid not in self._pending:
+                del self._written[uid]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="user-activity-flush")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+activity_tracker = UserActivityTracker()
+
 
 class DatabaseMiddleware(BaseMiddleware):
     """
@@ -15,22 +101,17 @@ class DatabaseMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         user = event.from_user
-        
-        user_id = register_user(
-            user_id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name
-        )
-        
+
+        user_id = await activity_tracker.register(user)
+
         if isinstance(event, Message) and event.text == "/start" or \
            isinstance(event, CallbackQuery) and event.data == "back_to_main":
-            session_id = start_session(user_id)
+            session_id = await astart_session(user_id)
             data["session_id"] = session_id
-            
+
             if isinstance(event, CallbackQuery) and hasattr(event, 'message'):
                 state = data.get('state')
                 if state:
                     await state.update_data(session_id=session_id)
-        
-        return await handler(event, data)
\ No newline at end of file
+
+        return await handler(event, data)
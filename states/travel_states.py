@@ -13,4 +13,8 @@ class TravelForm(StatesGroup):
     waiting_for_feedback = State()
     waiting_for_first_time = State()
     waiting_for_currency_location = State()
-    waiting_for_admin_id = State()
\ No newline at end of file
+    waiting_for_admin_id = State()
+    waiting_for_user_search = State()
+    waiting_for_tweak_budget = State()
+    waiting_for_tweak_days = State()
+    waiting_for_tweak_cuisine = State()